@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import signal
+import asyncio
+import functools
+import logging
+from typing import Callable, Dict, Any, List, Optional
+
+import httpx
+import redis
+import redis.asyncio as aioredis
+
+import codec
+import metrics
+from main import STOP_CHECK_INTERVAL, DuplicateMessage, InvalidMessage, RedisConsumer
+from response_cache import normalize_url
+from single_flight import AsyncSingleFlight
+from concurrency_limiter import AsyncConcurrencyLimiter, is_overload
+from circuit_breaker import CircuitOpen
+from retry_queue import pop_attempts
+from hedging import async_hedged_call
+from rate_limiter import AsyncClusterRateLimiter
+from redis_pool import AsyncConnectionPool, PoolExhausted
+
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO; we already log each API call ourselves
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+class AsyncRedisConsumer(RedisConsumer):
+    """asyncio variant of RedisConsumer
+
+    Validation, merging, key generation and serialization are inherited from
+    RedisConsumer so both engines produce identical records. Only the I/O is
+    replaced: redis.asyncio for intake, httpx for the detail view API and the
+    thread-safe boto3 client driven from worker threads for S3.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if self.intake_mode != 'list':
+            raise ValueError(f"INTAKE_MODE={self.intake_mode} is only supported by the sync engine")
+
+        self.hedge_executor = None  # Hedges are tasks here, not threads
+        self.s3_concurrency = max(1, int(os.getenv('S3_CONCURRENCY', 16)))
+        self.single_flight = AsyncSingleFlight() if self.max_in_flight > 1 else None
+        self.concurrency_limiter = None
+        if self.adaptive_concurrency:
+            self.concurrency_limiter = AsyncConcurrencyLimiter(self.create_adaptive_limit())
+
+        # Replace the blocking Redis client with an asyncio one; the blocking
+        # client stays around for scrape-time queue depth on the metrics thread
+        # and for the helpers run with asyncio.to_thread
+        self._sync_redis_client = self.redis_client
+        if self.rate_limiter is not None:
+            self.rate_limiter = AsyncClusterRateLimiter(
+                self._sync_redis_client,
+                self.api_rate_key,
+                self.api_rate_limit,
+                burst=self.api_rate_burst,
+                prefetch=self.api_rate_prefetch
+            )
+        # Any in-flight message may need a connection at once, plus intake
+        self.async_redis_pool = AsyncConnectionPool(
+            **self.redis_pool_options(self.redis_max_connections or self.max_in_flight + 8)
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.async_redis_pool)
+        for state in ('in_use', 'idle'):
+            metrics.REDIS_POOL_CONNECTIONS.labels(self.async_redis_pool.name, state).set_function(
+                lambda state=state: self.async_redis_pool.stats()[state]
+            )
+
+        # Created inside run() so they bind to the running event loop
+        self.http_client = None
+        self._in_flight_slots = None
+        self._s3_slots = None
+        self._tasks = set()
+
+        logger.info("Async Redis consumer initialized successfully")
+
+    def configured_concurrency(self) -> int:
+        # A single event loop can keep far more API calls in flight than threads
+        return max(1, int(os.getenv('MAX_IN_FLIGHT', 256)))
+
+    def queue_depth(self) -> int:
+        return self._sync_redis_client.llen(self.queue_name)
+
+    async def call_detail_view_api(self, url: str) -> Optional[Dict[str, Any]]:
+        """Call the detail view API, sharing one request among identical links in flight"""
+        if self.single_flight is None:
+            return await self._hedged_request(url)
+        return await self.single_flight.do(normalize_url(url), lambda: self._hedged_request(url))
+
+    async def _hedged_request(self, url: str) -> Optional[Dict[str, Any]]:
+        """Request the detail, racing a second request when the first is unusually slow"""
+        if self.latency_tracker is None:
+            return await self._request_detail(url)
+        return await async_hedged_call(
+            lambda: self._request_detail(url), self.latency_tracker, self.hedge_budget, refused=(CircuitOpen,)
+        )
+
+    async def _request_detail(self, url: str) -> Optional[Dict[str, Any]]:
+        """POST one URL to the detail view API"""
+        payload = {"url": url}
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+        try:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            if self.concurrency_limiter is not None:
+                await self.concurrency_limiter.acquire()
+        except BaseException:
+            # Cancelled while waiting (a lost hedge race or shutdown); the probe it claimed goes back
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.cancel_call()
+            raise
+
+        status = 'error'
+        started = time.monotonic()
+        try:
+            logger.info(f"Calling detail view API for URL: {url}")
+            response = await self.http_client.post(
+                self.detail_view_api,
+                content=codec.dumps(payload),
+                headers={'Content-Type': 'application/json'}
+            )
+            status = str(response.status_code)
+            response.raise_for_status()
+            return codec.loads(response.content)
+        except asyncio.CancelledError:
+            status = 'cancelled'  # Lost a hedge race or shutting down
+            raise
+        except httpx.TimeoutException:
+            status = 'timeout'
+            logger.error(f"API request timed out for URL: {url}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"API request failed for URL {url}: {str(e)}")
+            return None
+        except json.JSONDecodeError as e:
+            metrics.JSON_DECODE_FAILURES.labels('api').inc()
+            logger.error(f"Failed to parse API response for URL {url}: {str(e)}")
+            return None
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.API_REQUEST_SECONDS.labels(status).observe(elapsed)
+            if self.latency_tracker is not None and status.startswith('2'):
+                self.latency_tracker.record(elapsed)
+            if self.concurrency_limiter is not None:
+                await self.concurrency_limiter.release(elapsed, is_overload(status))
+            if self.circuit_breaker is not None and status == 'cancelled':
+                self.circuit_breaker.cancel_call()
+            elif self.circuit_breaker is not None:
+                if is_overload(status):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+    async def process_message(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Process a single message from Redis"""
+        if not self.validate_message(message):
+            raise InvalidMessage(f"Invalid URL: {message.get('link', 'Missing')}")
+
+        # The dedup filter lives in Redis and uses the blocking client, so it runs in a thread
+        if self.dedup_filter is not None and await asyncio.to_thread(self.dedup_filter.seen, message['link']):
+            cached = await self.cached_detail(message['link']) if self.dedup_action == 'merge' else None
+            if cached is None:
+                raise DuplicateMessage(message['link'])
+            return self.merge_api_response(message, cached)
+
+        api_response = await self.get_detail(message['link'])
+        if not api_response:
+            return None
+
+        return self.merge_api_response(message, api_response)
+
+    async def cached_detail(self, url: str) -> Optional[Dict[str, Any]]:
+        """Response cache lookup; local hits stay on the loop, the shared tier runs in a thread"""
+        cache = self.response_cache
+        cached = cache.get_local(url)
+        if cached is None and cache.redis_client is not None:
+            cached = await asyncio.to_thread(cache.get_shared, url)
+        return cached
+
+    async def get_detail(self, url: str) -> Optional[Dict[str, Any]]:
+        """Detail view API response for the URL, served from the response cache when possible"""
+        cache = self.response_cache
+        if cache is not None:
+            cached = await self.cached_detail(url)
+            if cached is not None:
+                return cached
+
+        api_response = await self.call_detail_view_api(url)
+        if api_response and cache is not None:
+            if cache.redis_client is not None:
+                await asyncio.to_thread(cache.put, url, api_response)
+            else:
+                cache.put(url, api_response)
+        return api_response
+
+    async def store_in_s3(self, data: Dict[str, Any], on_stored: Optional[Callable[[bool], None]] = None) -> bool:
+        """Store the combined data in S3 without blocking the event loop
+
+        on_stored, if given, is called on a worker thread with the outcome
+        once the record is actually in S3 (or failed to get there).
+        """
+        if self.s3_writer is not None:
+            try:
+                return await asyncio.to_thread(self.s3_writer.add, self.serialize_record(data), on_stored)
+            except Exception as e:
+                logger.error(f"Failed to buffer data for S3: {str(e)}")
+                return False
+
+        object_key = self.generate_object_key(extension='json' + self.compressor.extension)
+
+        try:
+            json_data = self.serialize_record(data)
+
+            if self.upload_pool is not None:
+                # Uploaded in the background like the sync engine; a full upload queue holds this task, not the loop
+                await asyncio.to_thread(
+                    self.upload_pool.submit, lambda: self._upload_object(object_key, json_data), on_stored
+                )
+                return True
+
+            async with self._s3_slots:
+                await asyncio.to_thread(self.put_object, object_key, json_data)
+
+            logger.info(f"Successfully stored data in S3: {object_key}")
+            if on_stored is not None:
+                await asyncio.to_thread(on_stored, True)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to store data in S3: {str(e)}")
+            return False
+
+    async def fetch_batch(self, max_wait: Optional[float] = None) -> List[str]:
+        """Pop up to queue_batch_size messages, blocking only while the queue is empty"""
+        started = time.monotonic()
+        deadline = started + (self.queue_max_wait if max_wait is None else max_wait)
+        try:
+            while True:
+                messages = await self._pop_batch(max(0.01, min(STOP_CHECK_INTERVAL, deadline - time.monotonic())))
+                if messages or self.stopping or time.monotonic() >= deadline:
+                    return messages
+        finally:
+            metrics.BLPOP_WAIT_SECONDS.observe(time.monotonic() - started)
+
+    async def _pop_batch(self, max_wait: float) -> List[str]:
+        if self.queue_batch_size > 1:
+            messages = await self.redis_client.lpop(self.queue_name, self.queue_batch_size)
+            if messages:
+                self._record_intake(len(messages))
+                return messages
+
+        item = await self.redis_client.blpop(self.queue_name, timeout=max_wait)
+        if not item:
+            return []
+
+        messages = [item[1]]
+        if self.queue_batch_size > 1:
+            messages.extend(await self.redis_client.lpop(self.queue_name, self.queue_batch_size - 1) or [])
+        self._record_intake(len(messages))
+        return messages
+
+    async def handle_message(self, message_json: str):
+        """Decode, process and store a single raw message from the queue"""
+        try:
+            message = self.decode_message(message_json)
+            attempts = pop_attempts(message)
+            logger.info(f"Processing message: {message.get('name', 'Unknown')}")
+
+            combined_data = await self.process_message(message)
+
+            if combined_data:
+                # Only the dedup filter needs the final outcome here; list intake has nothing to settle
+                on_stored = None
+                if self.dedup_filter is not None:
+                    on_stored = lambda ok: self.stored(message, None, ok)
+                stored = await self.store_in_s3(combined_data, on_stored=on_stored)
+                metrics.MESSAGES_PROCESSED.labels('stored' if stored else 'store_failed').inc()
+            else:
+                metrics.MESSAGES_PROCESSED.labels('failed').inc()
+                logger.warning(f"Failed to process message: {message.get('name', 'Unknown')}")
+                if not await asyncio.to_thread(self.retry_later, message, attempts):
+                    await asyncio.to_thread(
+                        self.dead_letter, message_json, 'retries_exhausted', 'Detail view API call failed', attempts + 1
+                    )
+
+        except InvalidMessage as e:
+            metrics.MESSAGES_PROCESSED.labels('invalid').inc()
+            await asyncio.to_thread(self.dead_letter, message_json, e.reason, str(e))
+        except CircuitOpen as e:
+            metrics.MESSAGES_PROCESSED.labels('deferred').inc()
+            logger.warning(f"Returning message to the queue: {str(e)}")
+            try:
+                await self.redis_client.lpush(self.queue_name, message_json)
+            except Exception as e:
+                logger.error(f"Failed to return message to the queue: {str(e)}")
+        except DuplicateMessage as e:
+            metrics.MESSAGES_PROCESSED.labels('duplicate').inc()
+            logger.info(f"Skipping link processed within the dedup window: {str(e)}")
+        except json.JSONDecodeError as e:
+            metrics.JSON_DECODE_FAILURES.labels('message').inc()
+            metrics.MESSAGES_PROCESSED.labels('invalid_json').inc()
+            logger.error(f"Failed to parse message as JSON: {str(e)}")
+            await asyncio.to_thread(self.dead_letter, message_json, 'invalid_json', str(e))
+        except Exception as e:
+            metrics.MESSAGES_PROCESSED.labels('error').inc()
+            logger.error(f"Unexpected error processing message: {str(e)}")
+            await asyncio.to_thread(
+                self.dead_letter, message_json, 'unexpected_error', f"{type(e).__name__}: {str(e)}"
+            )
+
+    async def dispatch_batch(self, messages: List[str]):
+        """Dispatch fetched messages in order; once a stop is requested the rest go back on the queue"""
+        for index, message_json in enumerate(messages):
+            if self.stopping:
+                logger.info(f"Returning {len(messages) - index} fetched messages to the queue")
+                await self.return_to_queue(messages[index:])
+                return
+            await self.dispatch(message_json)
+
+    async def dispatch(self, message_json: str, netloc: Optional[str] = None):
+        """Start a task for the message, waiting while max_in_flight is reached"""
+        await self._in_flight_slots.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        task = asyncio.create_task(self.handle_message(message_json))
+        self._tasks.add(task)
+        task.add_done_callback(functools.partial(self._task_done, netloc=netloc))
+
+    def _task_done(self, task: asyncio.Task, netloc: Optional[str] = None):
+        self._tasks.discard(task)
+        self._release_domain(netloc)
+        self.in_flight -= 1
+        self._in_flight_slots.release()
+
+    async def dispatch_scheduled(self):
+        """Dispatch every held message whose host has a free slot, then top up the scheduler"""
+        scheduler = self.domain_scheduler
+        while not self.stopping:
+            ready = scheduler.pop_ready()
+            if ready is None:
+                break
+            netloc, message_json = ready
+            await self.dispatch(message_json, netloc)
+        if self.stopping:
+            return
+
+        max_wait = None
+        if len(scheduler):
+            ready_in = scheduler.next_ready_in()
+            max_wait = min(self.queue_max_wait, max(0.01, 0.05 if ready_in is None else ready_in))
+        if len(scheduler) >= self.domain_backlog:
+            await asyncio.sleep(max_wait)
+            return
+        for message_json in await self.fetch_batch(max_wait):
+            scheduler.add(self.message_netloc(message_json), message_json)
+
+    async def return_scheduled(self):
+        """Put messages still held back by the domain scheduler back at the head of the queue"""
+        if self.domain_scheduler is None:
+            return
+        held = self.domain_scheduler.drain()
+        if held:
+            logger.info(f"Returning {len(held)} messages held for throttled hosts to the queue")
+        await self.return_to_queue(held)
+
+    async def return_to_queue(self, messages: List[str]):
+        """Push fetched messages that were never dispatched back to the head of the queue, keeping their order"""
+        if messages:
+            # LPUSH pushes its arguments one by one, so go backwards
+            await self.redis_client.lpush(self.queue_name, *reversed(messages))
+
+    async def wait_for_circuit(self):
+        """Hold intake while the circuit breaker refuses API calls"""
+        if self.circuit_breaker is None:
+            return
+        paused = False
+        while not self.stopping:
+            delay = self.circuit_breaker.retry_after()
+            if delay <= 0:
+                break
+            if not paused:
+                logger.warning(f"Detail view API circuit is {self.circuit_breaker.state}; pausing intake")
+                paused = True
+            await asyncio.sleep(min(delay, 1.0))
+        if paused:
+            logger.info("Resuming intake")
+
+    async def run(self):
+        """Main loop to process messages from Redis"""
+        logger.info(
+            f"Starting async consumer for queue: {self.queue_name} "
+            f"(batch size {self.queue_batch_size}, max in flight {self.max_in_flight})"
+        )
+        self._in_flight_slots = asyncio.BoundedSemaphore(self.max_in_flight)
+        self._s3_slots = asyncio.Semaphore(self.s3_concurrency)
+        self.http_client = httpx.AsyncClient(
+            timeout=self.api_timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight + self.hedge_headroom(),
+                max_keepalive_connections=self.http_pool_size
+            )
+        )
+        if self.upload_pool is not None:
+            self.upload_pool.start()
+        if self.s3_writer is not None:
+            self.s3_writer.start()
+        if self.retry_queue is not None:
+            self.retry_queue.start()
+        if self.metrics_port:
+            self.metrics_server = metrics.start_metrics_server(self.metrics_port)
+        metrics.MAX_IN_FLIGHT.set(self.max_in_flight)
+        # Stop intake on SIGTERM and let the tasks already started finish below
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.stop)
+
+        try:
+            while not self.stopping:
+                try:
+                    await self.wait_for_circuit()
+                    if self.domain_scheduler is not None:
+                        await self.dispatch_scheduled()
+                        continue
+                    await self.dispatch_batch(await self.fetch_batch())
+
+                except PoolExhausted as e:
+                    logger.warning(f"Redis pool exhausted, retrying intake: {str(e)}")
+                except redis.exceptions.ConnectionError:
+                    logger.error("Redis connection error. Attempting to reconnect...")
+                    await self._reconnect_redis()
+                except Exception as e:
+                    logger.error(f"Unexpected error in main loop: {str(e)}")
+                    await asyncio.sleep(1)
+            logger.info("Stop requested, no longer fetching messages")
+        finally:
+            try:
+                await self.return_scheduled()
+            except Exception as e:
+                logger.error(f"Failed to return held messages to the queue: {str(e)}")
+            # Let in-flight messages finish before closing their clients
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.http_client.aclose()
+            await self.redis_client.aclose()
+            await self.async_redis_pool.disconnect()
+            if self.s3_writer is not None:
+                await asyncio.to_thread(self.s3_writer.close)
+            if self.upload_pool is not None:
+                await asyncio.to_thread(self.upload_pool.close)
+            if self.retry_queue is not None:
+                await asyncio.to_thread(self.retry_queue.close)
+
+    async def _reconnect_redis(self):
+        """Reconnect to Redis in case of connection issues, keeping both pools"""
+        try:
+            await self.async_redis_pool.disconnect(inuse_connections=False)
+            self.redis_pool.disconnect(inuse_connections=False)
+            await self.redis_client.ping()
+            logger.info("Redis reconnected successfully")
+        except Exception as e:
+            logger.error(f"Failed to reconnect to Redis: {str(e)}")
+            await asyncio.sleep(5)
@@ -0,0 +1,347 @@
+"""End-to-end throughput benchmark for the consumer
+
+Starts local stand-ins for Redis, the detail view API and S3 (standins.py),
+runs main.py as a real subprocess against them and reports messages/sec,
+end-to-end latency percentiles (enqueue -> S3 PUT), consumer CPU time and
+peak RSS. Everything is seeded, so runs with the same flags are comparable.
+
+    python benchmark.py --messages 2000 --latency-ms 50 --engines sync,async \
+        --env MAX_IN_FLIGHT=64 --env QUEUE_BATCH_SIZE=50
+
+Pass --redis-url to use a real Redis for modes the stand-in does not cover.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+from standins import FakeDetailAPI, FakeS3, LatencyModel, MiniRedisServer, make_detail
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def link_host(i: int, domains: int, hot_share: float) -> str:
+    """Origin host for message i: hot_share of messages go to the first host, the rest round-robin"""
+    if domains <= 1:
+        return 'example.com'
+    if (i * 0.6180339887) % 1.0 < hot_share:  # Evenly spread, but deterministic
+        return 'site0.example.com'
+    return f'site{1 + i % (domains - 1)}.example.com'
+
+
+def make_message(i: int, args: argparse.Namespace) -> str:
+    host = link_host(i, args.domains, args.hot_domain_share)
+    return json.dumps({
+        'name': f'item-{i}',
+        'link': f'http://{host}/items/{i % args.distinct_links if args.distinct_links else i}',
+        'bench_enqueued_at': time.time()
+    })
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid and all of its descendants (Linux /proc)"""
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return pids
+    for child in children:
+        pids.extend(process_tree(child))
+    return pids
+
+
+def tree_usage(pids: List[int]) -> Tuple[float, float]:
+    """(CPU seconds, proportional set size in MB) of the given processes and their descendants
+
+    PSS splits shared pages between the processes sharing them, so unlike
+    summed RSS it shows what forked workers save over separate processes.
+    """
+    cpu = 0.0
+    pss_kb = 0
+    ticks = os.sysconf('SC_CLK_TCK')
+    for pid in {p for root in pids for p in process_tree(root)}:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rpartition(')')[2].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                pss_kb += sum(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except (OSError, IndexError, ValueError):
+            pass  # Exited meanwhile
+    return cpu, pss_kb / 1024
+
+
+class Queue:
+    """Pushes synthetic messages into the stand-in or a real Redis
+
+    With a stream_name, messages are XADDed to that stream instead of
+    RPUSHed to the list, for INTAKE_MODE=stream.
+    """
+
+    def __init__(self, queue_name: str, redis_url: Optional[str], stream_name: Optional[str] = None):
+        self.queue_name = queue_name
+        self.stream_name = stream_name
+        self.stand_in = None
+        self.client = None
+        if redis_url:
+            import redis
+            self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+            self.client.delete(queue_name, *filter(None, [stream_name]))
+            kwargs = self.client.connection_pool.connection_kwargs
+            self.host = kwargs.get('host', 'localhost')
+            self.port = kwargs.get('port', 6379)
+            self.db = kwargs.get('db', 0)
+        else:
+            self.stand_in = MiniRedisServer()
+            self.host, self.port, self.db = '127.0.0.1', self.stand_in.port, 0
+
+    def push(self, messages: List[str]):
+        if self.stream_name and self.stand_in is not None:
+            self.stand_in.xadd(self.stream_name, *messages)
+        elif self.stream_name:
+            pipe = self.client.pipeline(transaction=False)
+            for message in messages:
+                pipe.xadd(self.stream_name, {'message': message})
+            pipe.execute()
+        elif self.stand_in is not None:
+            self.stand_in.push(self.queue_name, *messages)
+        else:
+            self.client.rpush(self.queue_name, *messages)
+
+    def close(self):
+        if self.stand_in is not None:
+            self.stand_in.shutdown()
+            self.stand_in.server_close()
+
+
+def run_engine(engine: str, args: argparse.Namespace, extra_env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Run main.py once against fresh stand-ins and collect its numbers"""
+    queue_name = 'benchmark_queue'
+    overrides = dict(item.partition('=')[::2] for item in args.env)
+    overrides.update(extra_env or {})
+    stream_name = None
+    if overrides.get('INTAKE_MODE') == 'stream':
+        stream_name = overrides.get('STREAM_NAME', f'{queue_name}:stream')
+    queue = Queue(queue_name, args.redis_url, stream_name)
+    api = FakeDetailAPI(
+        LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma,
+                     args.tail_prob, args.tail_ms, seed=args.seed),
+        payload_bytes=args.payload_bytes,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        capacity=args.api_capacity,
+        outage_at=args.outage_at,
+        outage_seconds=args.outage_seconds,
+        origin_rate=args.origin_rate
+    )
+    s3 = FakeS3()
+
+    env = dict(os.environ)
+    env.update({
+        'CONSUMER_ENGINE': engine,
+        'REDIS_HOST': queue.host,
+        'REDIS_PORT': str(queue.port),
+        'REDIS_DB': str(queue.db),
+        'REDIS_PASSWORD': '',
+        'QUEUE_NAME': queue_name,
+        'QUEUE_MAX_WAIT': '1',
+        'DETAIL_VIEW_API': api.url,
+        'S3_ENDPOINT_URL': s3.url,
+        'S3_ACCESS_KEY': 'benchmark',
+        'S3_SECRET_KEY': 'benchmark',
+        'S3_BUCKET_NAME': 'benchmark',
+        'S3_BATCH_MAX_AGE': '1',
+        'INTAKE_REPORT_INTERVAL': '5',
+    })
+    env.update(overrides)
+
+    # Prefill measures raw drain rate; --rate produces a steady arrival stream instead
+    if not args.rate:
+        queue.push([make_message(i, args) for i in range(args.messages)])
+
+    log = open(os.path.join(HERE, f'bench_{engine}.log'), 'w')
+    # --processes runs one supervisor with that many workers instead of separate consumers
+    if args.processes:
+        env['CONSUMER_PROCESSES'] = str(args.processes)
+    entry_point = 'supervisor.py' if args.processes else 'main.py'
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(HERE, entry_point)], env=env,
+                         stdout=log, stderr=subprocess.STDOUT, cwd=HERE)
+        for _ in range(args.instances)
+    ]
+    started = time.time()
+
+    if args.rate:
+        interval = 1.0 / args.rate
+        next_at = time.monotonic()
+        for i in range(args.messages):
+            queue.push([make_message(i, args)])
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    completed = s3.wait_for(args.messages, args.timeout)
+    tree_cpu, pss_mb = tree_usage([process.pid for process in processes])
+
+    cpu = 0.0
+    rss_mb = 0.0
+    for process in processes:
+        process.send_signal(signal.SIGTERM)
+    for process in processes:
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cpu += usage.ru_utime + usage.ru_stime
+        rss_mb += usage.ru_maxrss / 1024
+    log.close()
+
+    # Measure from the first API call so interpreter start-up does not count
+    first = api.first_request_at or started
+    elapsed = (s3.last_record_at or time.time()) - first
+    result = {
+        'engine': engine,
+        'completed': completed,
+        'records': s3.records,
+        'objects': s3.objects,
+        'bytes': s3.bytes,
+        'elapsed': elapsed,
+        'throughput': s3.records / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(s3.latencies, 50),
+        'p95': percentile(s3.latencies, 95),
+        'p99': percentile(s3.latencies, 99),
+        # Workers forked by a supervisor are not its children, so wait4 would miss their CPU
+        'cpu': tree_cpu if args.processes else cpu,
+        'rss_mb': rss_mb,
+        'pss_mb': pss_mb,
+        'api_requests': api.requests,
+        'api_peak_concurrency': api.peak_active,
+        'api_throttled': api.throttled,
+        'api_peak_rate': api.peak_rate,
+    }
+
+    for server in (api, s3):
+        server.shutdown()
+        server.server_close()
+    queue.close()
+    return result
+
+
+def bench_compression(specs: List[str], payload_bytes: int, batch_size: int, seed: int, samples: int = 500):
+    """Report CPU cost vs bytes saved per record for each codec:level spec"""
+    from s3_writer import PayloadCompressor
+
+    rng = random.Random(seed)
+    records = [
+        json.dumps({'name': f'item-{i}', 'link': f'http://example.com/items/{i}', **make_detail('', payload_bytes, rng)})
+        for i in range(samples)
+    ]
+    batches = [records[i:i + batch_size] for i in range(0, samples, batch_size)]
+
+    print(f"compression over {samples} records of ~{payload_bytes} bytes (batch size {batch_size}):")
+    for spec in specs:
+        codec, _, level = spec.partition(':')
+        try:
+            PayloadCompressor(codec)
+        except ValueError as e:
+            print(f"  {spec:>8}: skipped ({e})")
+            continue
+        for mode, bodies in (('object', records), ('batch', ['\n'.join(b) + '\n' for b in batches])):
+            compressor = PayloadCompressor(codec, int(level) if level else None)
+            for body in bodies:
+                compressor.compress(body.encode('utf-8'))
+            saved = (compressor.raw_bytes - compressor.compressed_bytes) / samples
+            print(
+                f"  {spec:>8} per {mode:<6}: ratio {compressor.ratio():.3f}, "
+                f"{saved:.0f} bytes saved/record, {compressor.cpu_seconds / samples * 1e6:.1f} us CPU/record"
+            )
+
+
+def print_result(result: Dict[str, Any], label: Optional[str] = None):
+    status = '' if result['completed'] else '  (timed out)'
+    print(
+        f"{label or result['engine']:>8}: {result['records']} records in {result['objects']} objects, "
+        f"{result['elapsed']:.2f}s = {result['throughput']:.1f} msg/s{status}\n"
+        f"          e2e latency p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+        f"p99 {result['p99'] * 1000:.0f} ms\n"
+        f"          CPU {result['cpu']:.2f}s ({result['cpu'] / max(result['records'], 1) * 1e6:.0f} us/msg), "
+        f"peak RSS {result['rss_mb']:.1f} MB, PSS {result['pss_mb']:.1f} MB, {result['api_requests']} API calls "
+        f"(peak {result['api_peak_concurrency']} concurrent, {result['api_peak_rate']}/s, "
+        f"{result['api_throttled']} throttled), "
+        f"{result['bytes'] / 1024:.0f} KiB uploaded"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=0.0, help='messages/sec to enqueue; 0 prefills the queue')
+    parser.add_argument('--engines', default='sync,async')
+    parser.add_argument('--threads', default='',
+                        help='also run the threaded engine at each of these WORKER_THREADS, e.g. 1,2,4,8,16,32,64')
+    parser.add_argument('--instances', type=int, default=1,
+                        help='consumer processes sharing the queue; CPU and RSS are summed over them')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='run each instance as supervisor.py with this many worker processes')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--latency-dist', choices=('constant', 'normal', 'lognormal'), default='lognormal')
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--tail-prob', type=float, default=0.0, help='share of API calls that take --tail-ms')
+    parser.add_argument('--tail-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of API calls answered with 503')
+    parser.add_argument('--payload-bytes', type=int, default=2048)
+    parser.add_argument('--outage-at', type=float, default=0.0, help='seconds after the first API call to start an outage')
+    parser.add_argument('--outage-seconds', type=float, default=0.0, help='length of the API outage (all 503s); 0 for none')
+    parser.add_argument('--api-capacity', type=int, default=0,
+                        help='concurrent API requests before latency degrades (503 past twice this); 0 is unlimited')
+    parser.add_argument('--distinct-links', type=int, default=0,
+                        help='cycle through this many links to exercise caching and dedup; 0 makes every link unique')
+    parser.add_argument('--domains', type=int, default=1, help='spread links over this many origin hosts')
+    parser.add_argument('--hot-domain-share', type=float, default=0.0,
+                        help='share of links pointing at one hot host, with --domains > 1')
+    parser.add_argument('--origin-rate', type=int, default=0,
+                        help='requests/sec per origin host before the API answers 429; 0 is unlimited')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='consumer configuration, e.g. MAX_IN_FLIGHT=64')
+    parser.add_argument('--redis-url', help='use this Redis instead of the in-process stand-in')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--compression', default='gzip:1,gzip:6,zstd:3',
+                        help='codec:level specs to measure; empty to skip')
+    parser.add_argument('--compression-batch', type=int, default=50)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    for engine in filter(None, args.engines.split(',')):
+        print_result(run_engine(engine, args))
+
+    if args.threads:
+        print(f"threaded engine scaling ({args.messages} messages, {args.latency_ms:.0f} ms API latency):")
+        baseline = None
+        for threads in (int(count) for count in args.threads.split(',')):
+            result = run_engine('threaded', args, {'WORKER_THREADS': str(threads)})
+            baseline = baseline or result['throughput']
+            print_result(result, label=f'{threads} thr')
+            print(f"          speedup {result['throughput'] / baseline:.1f}x over {args.threads.split(',')[0]} thread(s)")
+
+    if args.compression:
+        bench_compression(args.compression.split(','), args.payload_bytes, args.compression_batch, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import time
+import logging
+import threading
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream the breaker considers down"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    After failure_threshold failures in a row the circuit opens and calls
+    are refused for reset_timeout seconds. It then goes half-open and lets
+    up to half_open_calls probes through at once: one success closes it,
+    one failure opens it again for another reset_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+
+        self.state = 'closed'
+        self.failures = 0
+        self.probes = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+        metrics.CIRCUIT_STATE.labels(name).set(STATES['closed'])
+
+    def before_call(self):
+        """Claim permission for one call, raising CircuitOpen if it must not go out"""
+        with self._lock:
+            self._refresh()
+            if self.state == 'open' or (self.state == 'half_open' and self.probes >= self.half_open_calls):
+                raise CircuitOpen(f"Circuit for {self.name} is {self.state}")
+            if self.state == 'half_open':
+                self.probes += 1
+
+    def cancel_call(self):
+        """Give back a call claimed with before_call that ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.probes = max(0, self.probes - 1)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == 'half_open':
+                self.probes = max(0, self.probes - 1)
+                self._transition('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open':
+                self.probes = max(0, self.probes - 1)
+                self._open()
+            elif self.state == 'closed' and self.failures >= self.failure_threshold:
+                self._open()
+
+    def retry_after(self) -> float:
+        """Seconds until a call could be let through; 0 when one can go now"""
+        with self._lock:
+            self._refresh()
+            if self.state == 'open':
+                return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+            if self.state == 'half_open' and self.probes >= self.half_open_calls:
+                return min(1.0, self.reset_timeout)  # Probes still out; check back shortly
+            return 0.0
+
+    def _refresh(self):
+        if self.state == 'open' and time.monotonic() >= self.opened_at + self.reset_timeout:
+            self._transition('half_open')
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._transition('open')
+
+    def _transition(self, state: str):
+        if state == self.state and state != 'open':
+            return
+        self.state = state
+        if state == 'half_open':
+            self.probes = 0
+        metrics.CIRCUIT_STATE.labels(self.name).set(STATES[state])
+        metrics.CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+        if state == 'open':
+            logger.warning(
+                f"Circuit for {self.name} opened after {self.failures} consecutive failures, "
+                f"probing again in {self.reset_timeout}s"
+            )
+        else:
+            logger.info(f"Circuit for {self.name} is now {state}")
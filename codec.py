@@ -0,0 +1,48 @@
+"""JSON codec shared by message decoding, API responses and S3 encoding
+
+Uses orjson when it is installed and falls back to the standard library.
+dumps() always returns UTF-8 bytes (non-ASCII kept as-is, like
+ensure_ascii=False) so records go to S3 without a str -> bytes re-encode.
+loads() returns what json.loads would: documents orjson rejects (NaN,
+Infinity, 1e400) or could decode inexactly (integers beyond 64 bits, which
+it turns into floats) are handed to the standard library, and decode
+errors are json.JSONDecodeError either way.
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Fall back to the standard library
+
+
+NAME = 'orjson' if orjson is not None else 'json'
+
+# Bytes with every ASCII digit as b'0' and everything else as a space; a run of
+# _LONG_DIGITS may be an integer beyond orjson's 64-bit range. A match inside a
+# string only costs the slower decode.
+_DIGITS = bytes(48 if 48 <= byte <= 57 else 32 for byte in range(256))
+_LONG_DIGITS = b'0' * 19
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """Decode a JSON document from text or UTF-8 bytes"""
+    if orjson is not None:
+        raw = data.encode('utf-8') if isinstance(data, str) else data
+        if _LONG_DIGITS not in raw.translate(_DIGITS):
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                pass  # Possibly NaN/Infinity, which the stdlib accepts; invalid JSON raises below
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib handles them
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import metrics
+
+
+def is_overload(status: str) -> bool:
+    """Whether an API outcome (status label) signals an overloaded upstream"""
+    return status in ('timeout', 'error', '429') or status.startswith('5')
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit driven by observed latency and failures
+
+    Each successful call whose latency stays within tolerance times the
+    baseline (the lowest latency seen, drifting slowly towards recent
+    samples) adds 1/limit, so the limit grows by about one per round trip.
+    Timeouts, 5xx responses, connection errors and latency beyond the
+    tolerance multiply it by backoff_ratio. The limit only grows while
+    callers actually use at least half of it.
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 256,
+                 backoff_ratio: float = 0.9, tolerance: float = 2.0):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.tolerance = tolerance
+        self.limit = float(min(self.max_limit, max(min_limit, initial)))
+        self.baseline = None
+        metrics.API_CONCURRENCY_LIMIT.set(int(self.limit))
+
+    def on_sample(self, latency: float, dropped: bool, in_flight: int):
+        if not dropped:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                # Let the baseline follow a lasting shift in upstream latency
+                self.baseline += (latency - self.baseline) * 0.01
+
+        if dropped or latency > self.baseline * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        elif in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        metrics.API_CONCURRENCY_LIMIT.set(int(self.limit))
+
+
+class ConcurrencyLimiter:
+    """Blocks callers while the adaptive limit's worth of calls is in flight"""
+
+    def __init__(self, limit: AdaptiveLimit):
+        self.limit = limit
+        self.in_flight = 0
+        self._changed = threading.Condition()
+
+    def acquire(self):
+        with self._changed:
+            while self.in_flight >= int(self.limit.limit):
+                self._changed.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, dropped: bool):
+        with self._changed:
+            self.limit.on_sample(latency, dropped, self.in_flight)
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+
+class AsyncConcurrencyLimiter:
+    """ConcurrencyLimiter for coroutines on one event loop"""
+
+    def __init__(self, limit: AdaptiveLimit):
+        self.limit = limit
+        self.in_flight = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, dropped: bool):
+        async with self._changed:
+            self.limit.on_sample(latency, dropped, self.in_flight)
+            self.in_flight -= 1
+            self._changed.notify_all()
@@ -0,0 +1,56 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import codec
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+class DeadLetterQueue:
+    """Redis list of messages the consumer gave up on
+
+    Each entry is a JSON object holding the original message string plus
+    why and when it failed, so it can be inspected and replayed with
+    dlq.py. The list is trimmed to the newest max_length entries.
+    """
+
+    def __init__(self, redis_client: Any, key: str, worker_id: str = '', max_length: int = 100000):
+        self.redis_client = redis_client
+        self.key = key
+        self.worker_id = worker_id
+        self.max_length = max_length
+
+    def add(self, message_json: str, reason: str, error: str = '', attempts: int = 1) -> bool:
+        entry = {
+            'message': message_json,
+            'reason': reason,
+            'error': error,
+            'attempts': attempts,
+            'failed_at': datetime.now(timezone.utc).isoformat(),
+            'worker': self.worker_id,
+        }
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.rpush(self.key, codec.dumps(entry))
+            if self.max_length > 0:
+                pipe.ltrim(self.key, -self.max_length, -1)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to dead-letter message ({reason}): {str(e)}")
+            return False
+        metrics.DEAD_LETTERED.labels(reason).inc()
+        return True
+
+    def size(self) -> int:
+        return self.redis_client.llen(self.key)
+
+
+def parse_entry(raw: str) -> Optional[Dict[str, Any]]:
+    """Decode a dead-letter entry, or None if it is not one"""
+    try:
+        entry = codec.loads(raw)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) and 'message' in entry else None
@@ -0,0 +1,90 @@
+import math
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List
+
+from response_cache import normalize_url
+
+
+logger = logging.getLogger(__name__)
+
+class DedupFilter:
+    """Shared Bloom filter of links processed within a time window
+
+    The filter is a plain Redis bitmap, so every worker sees the same set
+    without a Redis module. Time is cut into generations of `window` seconds,
+    each with its own key that expires after two generations; a link counts
+    as seen if it is in the current or the previous generation, so entries
+    are remembered for between one and two windows. Sizing follows the usual
+    Bloom formulas from the expected links per window (capacity) and the
+    target false-positive rate. Redis errors are logged and the link is
+    treated as new, so an outage costs duplicate work rather than data.
+    """
+
+    def __init__(self, redis_client: Any, key_prefix: str, window: float,
+                 capacity: int = 1000000, error_rate: float = 0.001):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        # m = -n ln p / (ln 2)^2 bits and k = m/n ln 2 hash functions
+        self.bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+
+    def seen(self, url: str) -> bool:
+        """Whether the link was added in the current or previous generation (may be a false positive)"""
+        current, previous = self._keys()
+        positions = self._positions(url)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in (current, previous):
+                for position in positions:
+                    pipe.getbit(key, position)
+            bits = pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to check dedup filter for URL {url}: {str(e)}")
+            return False
+        return all(bits[:self.hashes]) or all(bits[self.hashes:])
+
+    def add(self, url: str):
+        """Record the link as processed in the current generation"""
+        current, _ = self._keys()
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            for position in self._positions(url):
+                pipe.setbit(current, position, 1)
+            pipe.expire(current, int(math.ceil(self.window * 2)))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to add URL {url} to dedup filter: {str(e)}")
+
+    def stats(self) -> Dict[str, float]:
+        """Fill of the current generation, the estimated false-positive rate and memory in use"""
+        current, previous = self._keys()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in (current, previous):
+            pipe.bitcount(key)
+            pipe.strlen(key)
+        current_bits, current_bytes, previous_bits, previous_bytes = pipe.execute()
+        # A lookup checks both generations, so either can produce a false positive
+        current_fp = (current_bits / self.bits) ** self.hashes
+        previous_fp = (previous_bits / self.bits) ** self.hashes
+        return {
+            'fill_ratio': current_bits / self.bits,
+            'false_positive_rate': 1 - (1 - current_fp) * (1 - previous_fp),
+            'memory_bytes': current_bytes + previous_bytes,
+        }
+
+    def _keys(self) -> List[str]:
+        generation = int(time.time() // self.window)
+        return [f"{self.key_prefix}{generation}", f"{self.key_prefix}{generation - 1}"]
+
+    def _positions(self, url: str) -> List[int]:
+        # Double hashing: k positions from two independent 64-bit halves of one digest
+        digest = hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
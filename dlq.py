@@ -0,0 +1,227 @@
+"""Inspect and replay the consumer's dead-letter queue
+
+Reads the same environment (and .env) as main.py. Entries are filtered by
+reason, failure time and a substring of the original message, and replayed
+to QUEUE_NAME (or the intake stream) with pipelined pushes at a bounded rate.
+
+    python dlq.py stats
+    python dlq.py list --reason invalid_url --limit 20
+    python dlq.py replay --reason retries_exhausted --rate 500
+    python dlq.py purge --reason invalid_json
+"""
+import os
+import time
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import redis
+
+import codec
+from dead_letter import parse_entry
+from retry_queue import RETRY_FIELD
+
+
+def load_env():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass  # dotenv not installed
+
+
+def connect() -> redis.Redis:
+    return redis.Redis(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        db=int(os.getenv('REDIS_DB', 0)),
+        password=os.getenv('REDIS_PASSWORD', None),
+        decode_responses=True
+    )
+
+
+def parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def matches(entry: Dict[str, Any], args: argparse.Namespace) -> bool:
+    if args.reason and entry.get('reason') not in args.reason:
+        return False
+    if args.grep and args.grep not in entry.get('message', ''):
+        return False
+    if args.since or args.until:
+        try:
+            failed_at = parse_time(entry.get('failed_at', ''))
+        except ValueError:
+            return False
+        if args.since and failed_at < parse_time(args.since):
+            return False
+        if args.until and failed_at >= parse_time(args.until):
+            return False
+    return True
+
+
+def scan(client: redis.Redis, key: str, chunk: int) -> Iterator[Tuple[List[str], List[Optional[Dict[str, Any]]]]]:
+    """Yield the list in chunks of (raw entries, parsed entries), oldest first
+
+    The caller reports how many entries of each chunk it removed through the
+    generator's send(), so the next chunk starts at the right index while
+    new failures keep being appended at the tail.
+    """
+    index = 0
+    while True:
+        raw = client.lrange(key, index, index + chunk - 1)
+        if not raw:
+            return
+        removed = yield raw, [parse_entry(item) for item in raw]
+        index += len(raw) - (removed or 0)
+
+
+def replay_body(entry: Dict[str, Any]) -> str:
+    """The original message with its retry count reset, so it gets a full set of attempts"""
+    message_json = entry['message']
+    try:
+        message = codec.loads(message_json)
+    except ValueError:
+        return message_json  # Replayed as-is; it will fail the same way unless fixed upstream
+    if isinstance(message, dict) and RETRY_FIELD in message:
+        message.pop(RETRY_FIELD)
+        return codec.dumps(message).decode('utf-8')
+    return message_json
+
+
+def cmd_stats(client: redis.Redis, args: argparse.Namespace):
+    reasons = Counter()
+    oldest = newest = None
+    total = 0
+    for _, entries in scan(client, args.key, args.chunk):
+        for entry in entries:
+            total += 1
+            if entry is None:
+                reasons['<unreadable>'] += 1
+                continue
+            reasons[entry.get('reason', '?')] += 1
+            failed_at = entry.get('failed_at')
+            oldest = min(oldest or failed_at, failed_at) if failed_at else oldest
+            newest = max(newest or failed_at, failed_at) if failed_at else newest
+    print(f"{args.key}: {total} entries" + (f", {oldest} .. {newest}" if oldest else ''))
+    for reason, count in reasons.most_common():
+        print(f"  {reason:<20} {count}")
+
+
+def cmd_list(client: redis.Redis, args: argparse.Namespace):
+    shown = 0
+    for _, entries in scan(client, args.key, args.chunk):
+        for entry in entries:
+            if entry is None or not matches(entry, args):
+                continue
+            if args.json:
+                print(codec.dumps(entry).decode('utf-8'))
+            else:
+                print(
+                    f"{entry.get('failed_at', '?')}  {entry.get('reason', '?'):<18} "
+                    f"attempts={entry.get('attempts', '?')}  {entry.get('error', '')}\n    {entry['message']}"
+                )
+            shown += 1
+            if args.limit and shown >= args.limit:
+                return
+
+
+def cmd_replay(client: redis.Redis, args: argparse.Namespace, purge_only: bool = False):
+    """Push matching entries back to the queue (or just delete them) in pipelined batches"""
+    done = 0
+    started = time.monotonic()
+    chunks = scan(client, args.key, args.chunk)
+    chunk = next(chunks, None)
+    while chunk is not None:
+        raw, entries = chunk
+        selected = [(item, entry) for item, entry in zip(raw, entries) if entry is not None and matches(entry, args)]
+        if args.limit:
+            selected = selected[:max(0, args.limit - done)]
+
+        removed = 0
+        for start in range(0, len(selected), args.batch):
+            batch = selected[start:start + args.batch]
+            if not args.dry_run:
+                pipe = client.pipeline(transaction=True)
+                for item, entry in batch:
+                    if not purge_only:
+                        if args.stream:
+                            pipe.xadd(args.stream, {'message': replay_body(entry)})
+                        else:
+                            pipe.rpush(args.queue, replay_body(entry))
+                    if not args.keep:
+                        pipe.lrem(args.key, 1, item)
+                pipe.execute()
+                if not args.keep:
+                    removed += len(batch)
+            done += len(batch)
+            if args.rate and not purge_only:
+                # Stay at or below --rate messages per second overall
+                time.sleep(max(0.0, done / args.rate - (time.monotonic() - started)))
+
+        if args.limit and done >= args.limit:
+            break
+        try:
+            chunk = chunks.send(removed)
+        except StopIteration:
+            break
+
+    verb = 'purged' if purge_only else 'replayed'
+    target = '' if purge_only else f" to {args.stream or args.queue}"
+    suffix = ' (dry run)' if args.dry_run else ''
+    print(f"{done} entries {verb}{target} in {time.monotonic() - started:.2f}s{suffix}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    queue_name = os.getenv('QUEUE_NAME', 'processing_queue')
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--key', default=os.getenv('DEAD_LETTER_QUEUE') or f'{queue_name}:dead',
+                        help='dead-letter list (default DEAD_LETTER_QUEUE)')
+    parser.add_argument('--chunk', type=int, default=1000, help='entries read per LRANGE')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('stats', help='count entries by reason')
+    for name in ('list', 'replay', 'purge'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--reason', action='append', help='only this failure reason; repeatable')
+        sub.add_argument('--since', help='only entries that failed at or after this ISO time')
+        sub.add_argument('--until', help='only entries that failed before this ISO time')
+        sub.add_argument('--grep', help='only entries whose message contains this text')
+        sub.add_argument('--limit', type=int, default=0, help='stop after this many entries; 0 for all')
+        if name == 'list':
+            sub.add_argument('--json', action='store_true', help='print raw entries as JSON lines')
+        else:
+            sub.add_argument('--batch', type=int, default=500, help='entries per pipelined round trip')
+            sub.add_argument('--dry-run', action='store_true')
+        if name != 'replay':
+            sub.set_defaults(queue=None, stream=None, rate=0.0, keep=False)
+        if name == 'replay':
+            sub.add_argument('--queue', default=queue_name, help='list to push to (default QUEUE_NAME)')
+            stream_name = os.getenv('STREAM_NAME', f'{queue_name}:stream')
+            sub.add_argument('--stream', default=stream_name if os.getenv('INTAKE_MODE', 'list') == 'stream' else None,
+                             help='XADD to this stream instead (default STREAM_NAME in stream mode)')
+            sub.add_argument('--rate', type=float, default=0.0, help='max messages/sec; 0 is unlimited')
+            sub.add_argument('--keep', action='store_true', help='leave replayed entries in the dead-letter queue')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    load_env()
+    args = build_parser().parse_args(argv)
+    client = connect()
+
+    if args.command == 'stats':
+        cmd_stats(client, args)
+    elif args.command == 'list':
+        cmd_list(client, args)
+    elif args.command == 'replay':
+        cmd_replay(client, args)
+    else:
+        cmd_replay(client, args, purge_only=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import metrics
+
+
+class DomainLimiter:
+    """Per-netloc token buckets and in-flight caps
+
+    Each origin host gets `rate` calls per second with bursts of up to
+    `burst`, and at most `max_in_flight` messages at once (0 for no cap).
+    A slot is reserved with try_acquire when a message is dispatched and
+    given back with release once it is done. Idle hosts are forgotten once
+    more than max_domains are tracked.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: float = 0.0, max_in_flight: int = 0,
+                 max_domains: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.max_in_flight = max_in_flight
+        self.max_domains = max_domains
+        # netloc -> [tokens, last refill, in flight]
+        self._domains: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def ready_in(self, netloc: str) -> Optional[float]:
+        """Seconds until the host can take another call: 0 now, None while it is at its in-flight cap"""
+        with self._lock:
+            return self._ready_in(self._refill(netloc))
+
+    def try_acquire(self, netloc: str) -> bool:
+        with self._lock:
+            state = self._refill(netloc)
+            if self._ready_in(state) != 0:
+                return False
+            if self.rate > 0:
+                state[0] -= 1.0
+            state[2] += 1
+            return True
+
+    def release(self, netloc: str):
+        with self._lock:
+            state = self._domains.get(netloc)
+            if state is not None:
+                state[2] = max(0, state[2] - 1)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(state[2] for state in self._domains.values())
+
+    def __len__(self) -> int:
+        return len(self._domains)
+
+    def _refill(self, netloc: str) -> list:
+        now = time.monotonic()
+        state = self._domains.get(netloc)
+        if state is None:
+            if len(self._domains) >= self.max_domains:
+                self._forget_idle(now)
+            state = self._domains[netloc] = [self.burst, now, 0]
+        elif self.rate > 0:
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+        return state
+
+    def _ready_in(self, state: list) -> Optional[float]:
+        if self.max_in_flight and state[2] >= self.max_in_flight:
+            return None
+        if self.rate > 0 and state[0] < 1.0:
+            return (1.0 - state[0]) / self.rate
+        return 0.0
+
+    def _forget_idle(self, now: float):
+        """Drop hosts with nothing in flight whose bucket would be full again anyway"""
+        for netloc, (tokens, refilled, in_flight) in list(self._domains.items()):
+            if in_flight == 0 and (self.rate <= 0 or tokens + (now - refilled) * self.rate >= self.burst):
+                del self._domains[netloc]
+
+
+class DomainScheduler:
+    """Holds fetched messages per host and hands them out round-robin as limits allow
+
+    Messages for a throttled host wait here instead of on a worker, so the
+    workers stay busy with other hosts. A None netloc (undecodable or
+    invalid message) is never limited; it fails fast in handle_message.
+    """
+
+    def __init__(self, limiter: DomainLimiter):
+        self.limiter = limiter
+        self._queues: 'OrderedDict[Optional[str], Deque[Any]]' = OrderedDict()
+        self._size = 0
+
+    def add(self, netloc: Optional[str], item: Any):
+        self._queues.setdefault(netloc, deque()).append(item)
+        self._size += 1
+        metrics.DOMAIN_BACKLOG.set(self._size)
+
+    def pop_ready(self) -> Optional[Tuple[Optional[str], Any]]:
+        """Next (netloc, item) whose host has a slot, reserving that slot; None if every host is throttled"""
+        for netloc in list(self._queues):
+            if netloc is not None and not self.limiter.try_acquire(netloc):
+                continue
+            queue = self._queues.pop(netloc)
+            item = queue.popleft()
+            if queue:
+                self._queues[netloc] = queue  # Back of the line, behind the other hosts
+            self._size -= 1
+            metrics.DOMAIN_BACKLOG.set(self._size)
+            return netloc, item
+        return None
+
+    def next_ready_in(self) -> Optional[float]:
+        """Seconds until some waiting host frees up, None if all are waiting on in-flight calls"""
+        waits = [self.limiter.ready_in(netloc) for netloc in self._queues if netloc is not None]
+        timed = [wait for wait in waits if wait is not None]
+        return min(timed) if timed else None
+
+    def drain(self) -> list:
+        """Remove and return every held item, e.g. to put them back on the queue at shutdown"""
+        items = [item for queue in self._queues.values() for item in queue]
+        self._queues.clear()
+        self._size = 0
+        metrics.DOMAIN_BACKLOG.set(0)
+        return items
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,162 @@
+import math
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, TimeoutError, wait
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+import metrics
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies with a cached percentile"""
+
+    def __init__(self, percentile: float = 95.0, window: int = 1000, min_samples: int = 50,
+                 min_delay: float = 0.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._cached: Optional[float] = None
+        self._since_refresh = 0
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._since_refresh += 1
+
+    def threshold(self) -> Optional[float]:
+        """Latency at the configured percentile, or None until enough samples are in"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            # Re-sorting on every call would cost more than the hedge saves
+            if self._cached is None or self._since_refresh >= max(10, len(self._samples) // 20):
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(math.ceil(self.percentile / 100 * len(ordered))) - 1)
+                self._cached = max(self.min_delay, ordered[max(0, index)])
+                self._since_refresh = 0
+                metrics.API_HEDGE_DELAY.set(self._cached)
+            return self._cached
+
+
+class HedgeBudget:
+    """Caps hedges at a fraction of all calls, e.g. 0.05 for at most 5% extra load
+
+    Every call earns `ratio` of a token (up to `burst`) and each hedge spends
+    a whole one. At most `max_outstanding` hedged calls (0 for no cap) may
+    have a copy still running; in the sync engine that bounds the threads
+    and connections held by losers nobody waits for any more.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0, max_outstanding: int = 0):
+        self.ratio = ratio
+        self.burst = burst
+        self.max_outstanding = max_outstanding
+        self.outstanding = 0
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take a token for one hedge; finish() must follow once both copies are done"""
+        with self._lock:
+            if self._tokens < 1.0 or (self.max_outstanding and self.outstanding >= self.max_outstanding):
+                return False
+            self._tokens -= 1.0
+            self.outstanding += 1
+            return True
+
+    def finish(self, *args):
+        with self._lock:
+            self.outstanding -= 1
+
+
+def hedged_call(executor: Executor, function: Callable[[], Any], tracker: LatencyTracker,
+                budget: HedgeBudget, refused: Tuple[Type[BaseException], ...] = ()) -> Any:
+    """Run function, starting a second copy if the first is slower than the tracked percentile
+
+    The first successful (non-None) result wins. Blocking calls cannot be
+    interrupted, so a losing copy runs to completion in the background and
+    its result is discarded. A hedge that raises one of `refused` (it was
+    never sent, e.g. CircuitOpen) leaves the first copy to finish alone.
+    """
+    budget.earn()
+    delay = tracker.threshold()
+    if delay is None:
+        return function()
+
+    primary = executor.submit(function)
+    try:
+        return primary.result(timeout=delay)
+    except TimeoutError:
+        pass
+    if not budget.try_spend():
+        metrics.API_HEDGES.labels('over_budget').inc()
+        return primary.result()
+
+    metrics.API_HEDGES.labels('sent').inc()
+    hedge = executor.submit(function)
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future is hedge and isinstance(future.exception(), refused):
+                    metrics.API_HEDGES.labels('refused').inc()
+                    continue
+                result = future.result()
+                if result is not None or not pending:
+                    metrics.API_HEDGES.labels('won' if future is hedge else 'lost').inc()
+                    return result
+        return primary.result()  # Finished without a result before its hedge was refused
+    finally:
+        # The loser keeps its thread and connection until it finishes on its own
+        if pending:
+            pending.pop().add_done_callback(budget.finish)
+        else:
+            budget.finish()
+
+
+async def async_hedged_call(function: Callable[[], Awaitable[Any]], tracker: LatencyTracker,
+                            budget: HedgeBudget, refused: Tuple[Type[BaseException], ...] = ()) -> Any:
+    """hedged_call for coroutines; the losing copy is cancelled"""
+    budget.earn()
+    delay = tracker.threshold()
+    if delay is None:
+        return await function()
+
+    primary = asyncio.ensure_future(function())
+    hedge = None
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+        if not budget.try_spend():
+            metrics.API_HEDGES.labels('over_budget').inc()
+            return await primary
+
+        metrics.API_HEDGES.labels('sent').inc()
+        hedge = asyncio.ensure_future(function())
+        pending.add(hedge)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is hedge and isinstance(task.exception(), refused):
+                    metrics.API_HEDGES.labels('refused').inc()
+                    continue
+                result = task.result()
+                if result is not None or not pending:
+                    metrics.API_HEDGES.labels('won' if task is hedge else 'lost').inc()
+                    return result
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if hedge is not None:
+            budget.finish()
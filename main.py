@@ -2,12 +2,35 @@ import os
 import json
 import redis
 import boto3
+from botocore.config import Config as BotoConfig
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 from datetime import datetime
 from urllib.parse import urlparse
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional, Tuple
 import time
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import codec
+import metrics
+from reliable_queue import ReliableQueue
+from stream_queue import StreamQueue
+from response_cache import ResponseCache, normalize_url
+from dedup_filter import DedupFilter
+from single_flight import SingleFlight
+from concurrency_limiter import AdaptiveLimit, ConcurrencyLimiter, is_overload
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from retry_queue import RetryQueue, pop_attempts
+from dead_letter import DeadLetterQueue
+from hedging import HedgeBudget, LatencyTracker, hedged_call
+from domain_limiter import DomainLimiter, DomainScheduler
+from rate_limiter import ClusterRateLimiter
+from redis_pool import ConnectionPool, PoolExhausted, parser_name, pool_options
+from s3_writer import PayloadCompressor, S3BatchWriter, S3UploadPool
 
 
 # Configure logging
@@ -17,6 +40,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Longest a single blocking queue read may take, so a stop request is noticed while the queue is empty
+STOP_CHECK_INTERVAL = 1.0
+
+class DuplicateMessage(Exception):
+    """Raised by process_message for a link already processed within the dedup window"""
+
+
+class InvalidMessage(Exception):
+    """Raised for a message that can never succeed, e.g. a bad link; reason is its dead-letter reason"""
+
+    def __init__(self, detail: str, reason: str = 'invalid_url'):
+        super().__init__(detail)
+        self.reason = reason
+
+
 class RedisConsumer:
     def __init__(self):
         # Load configuration from environment variables
@@ -25,8 +63,80 @@ class RedisConsumer:
         self.redis_db = int(os.getenv('REDIS_DB', 0))
         self.redis_password = os.getenv('REDIS_PASSWORD', None)
         self.queue_name = os.getenv('QUEUE_NAME', 'processing_queue')
+        self.queue_batch_size = max(1, int(os.getenv('QUEUE_BATCH_SIZE', 1)))  # Messages drained per round trip
+        self.queue_max_wait = int(os.getenv('QUEUE_MAX_WAIT', 30))  # Seconds to block when the queue is empty
+        # Redis connection pool: 0 sizes it to the configured concurrency plus background threads;
+        # callers wait up to REDIS_POOL_TIMEOUT seconds when every connection is busy
+        self.redis_max_connections = max(0, int(os.getenv('REDIS_MAX_CONNECTIONS', 0)))
+        self.redis_pool_timeout = float(os.getenv('REDIS_POOL_TIMEOUT', 20))
+        self.redis_health_check_interval = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+        self.redis_socket_keepalive = os.getenv('REDIS_SOCKET_KEEPALIVE', 'true').lower() == 'true'
+        # 'list' pops messages (BLPOP); 'reliable' keeps them in a per-worker list until stored;
+        # 'stream' reads a Redis Stream through a consumer group
+        self.intake_mode = os.getenv('INTAKE_MODE', 'list').lower()
+        self.stream_name = os.getenv('STREAM_NAME', f"{self.queue_name}:stream")
+        self.consumer_group = os.getenv('CONSUMER_GROUP', 'consumers')
+        self.stream_claim_idle_ms = int(os.getenv('STREAM_CLAIM_IDLE_MS', 0))  # 0 derives it from API_TIMEOUT
+        self.worker_id = os.getenv('WORKER_ID', f"{socket.gethostname()}:{os.getpid()}")
+        self.ack_batch_size = max(1, int(os.getenv('ACK_BATCH_SIZE', 50)))
+        self.ack_flush_interval = float(os.getenv('ACK_FLUSH_INTERVAL', 1))
+        self.worker_heartbeat_ttl = int(os.getenv('WORKER_HEARTBEAT_TTL', 30))
+        self.reaper_interval = float(os.getenv('REAPER_INTERVAL', 30))
+        # Failed messages are retried with exponential backoff up to this many attempts in total;
+        # 0 or 1 disables retries
+        self.retry_max_attempts = max(0, int(os.getenv('RETRY_MAX_ATTEMPTS', 0)))
+        self.retry_base_delay = float(os.getenv('RETRY_BASE_DELAY', 2))
+        self.retry_max_delay = float(os.getenv('RETRY_MAX_DELAY', 300))
+        self.retry_key = os.getenv('RETRY_KEY', f"{self.queue_name}:retry")
+        # Messages given up on are kept here for dlq.py; set it empty to just drop them
+        self.dead_letter_queue = os.getenv('DEAD_LETTER_QUEUE', f"{self.queue_name}:dead")
+        self.dead_letter_max_length = max(0, int(os.getenv('DEAD_LETTER_MAX_LENGTH', 100000)))
         self.detail_view_api = os.getenv('DETAIL_VIEW_API', 'http://localhost:8000/api/detail')
         self.api_timeout = int(os.getenv('API_TIMEOUT', 45))  # Slightly more than 40 seconds
+        # Messages processed concurrently; 1 keeps strict queue order, >1 completes out of order
+        self.max_in_flight = self.configured_concurrency()
+        # Hedge API calls slower than this latency percentile (0 disables), spending at most
+        # HEDGE_BUDGET extra requests per call
+        self.hedge_percentile = float(os.getenv('HEDGE_PERCENTILE', 0))
+        self.hedge_budget_ratio = float(os.getenv('HEDGE_BUDGET', 0.05))
+        self.hedge_min_delay = float(os.getenv('HEDGE_MIN_DELAY', 0.05))
+        # Successful calls to observe before the percentile is trusted and hedging starts
+        self.hedge_min_samples = max(1, int(os.getenv('HEDGE_MIN_SAMPLES', 50)))
+        # Hedged calls whose losing copy may still be running; the sync engine cannot interrupt
+        # a loser, so each one holds a thread and an HTTP connection until it finishes
+        self.hedge_max_outstanding = max(1, int(os.getenv('HEDGE_MAX_OUTSTANDING', self.max_in_flight)))
+        # Keep-alive connections held per API host; defaults to one per in-flight message plus hedges
+        self.http_pool_size = max(1, int(os.getenv('HTTP_POOL_SIZE', self.max_in_flight + self.hedge_headroom())))
+        # Per origin host (the link's netloc): messages per second with bursts, and messages in flight;
+        # 0 disables each. Up to DOMAIN_BACKLOG fetched messages wait for throttled hosts
+        self.domain_rate_limit = float(os.getenv('DOMAIN_RATE_LIMIT', 0))
+        self.domain_burst = float(os.getenv('DOMAIN_BURST', 0))
+        self.domain_max_in_flight = max(0, int(os.getenv('DOMAIN_MAX_IN_FLIGHT', 0)))
+        self.domain_backlog = max(1, int(os.getenv('DOMAIN_BACKLOG', 1000)))
+        # Detail view API calls per second across every consumer instance sharing this Redis; 0 disables.
+        # Each instance takes up to API_RATE_PREFETCH calls at a time from Redis
+        self.api_rate_limit = float(os.getenv('API_RATE_LIMIT', 0))
+        self.api_rate_burst = float(os.getenv('API_RATE_BURST', 0))
+        self.api_rate_prefetch = max(1, int(os.getenv('API_RATE_PREFETCH', 10)))
+        self.api_rate_key = os.getenv('API_RATE_KEY', f'{self.queue_name}:api_rate')
+        # Adapt the number of concurrent API calls (within MAX_IN_FLIGHT) to upstream latency and errors
+        self.adaptive_concurrency = os.getenv('ADAPTIVE_CONCURRENCY', 'false').lower() == 'true'
+        self.api_latency_tolerance = float(os.getenv('API_LATENCY_TOLERANCE', 2.0))
+        self.api_backoff_ratio = float(os.getenv('API_BACKOFF_RATIO', 0.9))
+        # Stop calling (and pause intake) after this many consecutive API failures; 0 disables
+        self.circuit_failure_threshold = max(0, int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 0)))
+        self.circuit_reset_timeout = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+        self.circuit_half_open_calls = max(1, int(os.getenv('CIRCUIT_HALF_OPEN_CALLS', 1)))
+        # Detail view response cache; a TTL of 0 disables it
+        self.response_cache_ttl = float(os.getenv('RESPONSE_CACHE_TTL', 0))
+        self.response_cache_size = max(0, int(os.getenv('RESPONSE_CACHE_SIZE', 10000)))
+        self.response_cache_shared = os.getenv('RESPONSE_CACHE_SHARED', 'true').lower() == 'true'
+        # Skip links already processed within DEDUP_WINDOW seconds (0 disables); 'drop' discards
+        # duplicates, 'merge' still stores them when the response cache has their details
+        self.dedup_window = float(os.getenv('DEDUP_WINDOW', 0))
+        self.dedup_capacity = max(1, int(os.getenv('DEDUP_CAPACITY', 1000000)))
+        self.dedup_error_rate = float(os.getenv('DEDUP_ERROR_RATE', 0.001))
+        self.dedup_action = os.getenv('DEDUP_ACTION', 'drop').lower()
         
         # S3 configuration
         self.s3_access_key = os.getenv('S3_ACCESS_KEY')
@@ -34,29 +144,232 @@ class RedisConsumer:
         self.s3_endpoint = os.getenv('S3_ENDPOINT_URL')
         self.s3_bucket = os.getenv('S3_BUCKET_NAME')
         self.s3_region = os.getenv('S3_REGION', 'us-east-1')
+        # Records aggregated into one NDJSON object; 1 keeps one object per message
+        self.s3_batch_max_records = max(1, int(os.getenv('S3_BATCH_MAX_RECORDS', 1)))
+        self.s3_batch_max_bytes = int(os.getenv('S3_BATCH_MAX_BYTES', 8 * 1024 * 1024))
+        self.s3_batch_max_age = float(os.getenv('S3_BATCH_MAX_AGE', 60))
+        # Object compression: none, gzip or zstd, with an optional codec level
+        self.s3_compression = os.getenv('S3_COMPRESSION', 'none')
+        self.s3_compression_level = int(os.getenv('S3_COMPRESSION_LEVEL')) if os.getenv('S3_COMPRESSION_LEVEL') else None
+        # Background upload threads; 0 uploads inline on the processing thread
+        self.s3_upload_workers = max(0, int(os.getenv('S3_UPLOAD_WORKERS', 0)))
+        self.s3_upload_queue_depth = max(1, int(os.getenv('S3_UPLOAD_QUEUE_DEPTH', 100)))
         
         # Validate required environment variables
         self._validate_env_vars()
         
-        # Initialize Redis connection
-        self.redis_client = redis.Redis(
-            host=self.redis_host,
-            port=self.redis_port,
-            db=self.redis_db,
-            password=self.redis_password,
-            decode_responses=True
-        )
+        # Initialize Redis connection; every helper shares this client and its pool
+        self.redis_pool = ConnectionPool(**self.redis_pool_options())
+        self.redis_client = redis.Redis(connection_pool=self.redis_pool)
+        
+        # At-least-once intake backends, acknowledged once the record is in S3
+        self.intake_backend = None
+        if self.intake_mode == 'reliable':
+            self.intake_backend = ReliableQueue(
+                self.redis_client,
+                self.queue_name,
+                self.worker_id,
+                ack_batch_size=self.ack_batch_size,
+                ack_interval=self.ack_flush_interval,
+                heartbeat_ttl=self.worker_heartbeat_ttl,
+                reaper_interval=self.reaper_interval
+            )
+        elif self.intake_mode == 'stream':
+            # An entry stays pending through its API call and, when batching, the batch flush;
+            # another consumer claiming it before then would process it a second time
+            hold_ms = 1000 * (self.api_timeout + (self.s3_batch_max_age if self.s3_batch_max_records > 1 else 0))
+            if not self.stream_claim_idle_ms:
+                self.stream_claim_idle_ms = int(max(60000, 2 * hold_ms))
+            elif self.stream_claim_idle_ms <= hold_ms:
+                raise ValueError(
+                    f"STREAM_CLAIM_IDLE_MS must exceed API_TIMEOUT plus S3_BATCH_MAX_AGE ({hold_ms:.0f} ms)"
+                )
+            self.intake_backend = StreamQueue(
+                self.redis_client,
+                self.stream_name,
+                self.consumer_group,
+                self.worker_id,
+                ack_batch_size=self.ack_batch_size,
+                ack_interval=self.ack_flush_interval,
+                claim_idle_ms=self.stream_claim_idle_ms,
+                claim_interval=self.reaper_interval
+            )
+        elif self.intake_mode != 'list':
+            raise ValueError(f"Unsupported INTAKE_MODE: {self.intake_mode}")
+        
+        # Delayed retries go back to wherever this consumer reads from
+        self.retry_queue = None
+        if self.retry_max_attempts > 1:
+            stream = self.intake_mode == 'stream'
+            self.retry_queue = RetryQueue(
+                self.redis_client,
+                self.retry_key,
+                self.stream_name if stream else self.queue_name,
+                target_type='stream' if stream else 'list',
+                max_attempts=self.retry_max_attempts,
+                base_delay=self.retry_base_delay,
+                max_delay=self.retry_max_delay
+            )
+        
+        self.dead_letters = None
+        if self.dead_letter_queue:
+            self.dead_letters = DeadLetterQueue(
+                self.redis_client,
+                self.dead_letter_queue,
+                self.worker_id,
+                max_length=self.dead_letter_max_length
+            )
+        
+        # Shared budget for the combined request rate of all instances
+        self.rate_limiter = None
+        if self.api_rate_limit > 0:
+            self.rate_limiter = ClusterRateLimiter(
+                self.redis_client,
+                self.api_rate_key,
+                self.api_rate_limit,
+                burst=self.api_rate_burst,
+                prefetch=self.api_rate_prefetch
+            )
+        
+        # Interleave hosts so one busy origin does not get hammered or hold up the others
+        self.domain_scheduler = None
+        if self.domain_rate_limit > 0 or self.domain_max_in_flight > 0:
+            self.domain_scheduler = DomainScheduler(
+                DomainLimiter(self.domain_rate_limit, self.domain_burst, self.domain_max_in_flight)
+            )
+        
+        # Serve repeated links from memory or Redis instead of calling the API again
+        self.response_cache = None
+        if self.response_cache_ttl > 0:
+            self.response_cache = ResponseCache(
+                self.redis_client if self.response_cache_shared else None,
+                max_entries=self.response_cache_size,
+                ttl=self.response_cache_ttl,
+                key_prefix=f"{self.queue_name}:detail_cache:"
+            )
         
-        # Initialize S3 client
+        # Shared window of recently processed links
+        self.dedup_filter = None
+        if self.dedup_window > 0:
+            if self.dedup_action not in ('drop', 'merge'):
+                raise ValueError(f"Unsupported DEDUP_ACTION: {self.dedup_action}")
+            if self.dedup_action == 'merge' and self.response_cache is None:
+                raise ValueError("DEDUP_ACTION=merge requires RESPONSE_CACHE_TTL")
+            self.dedup_filter = DedupFilter(
+                self.redis_client,
+                f"{self.queue_name}:dedup:",
+                self.dedup_window,
+                capacity=self.dedup_capacity,
+                error_rate=self.dedup_error_rate
+            )
+        
+        # Initialize S3 client; one client (and connection pool) is shared by every thread that
+        # uploads, so the pool must fit them all or extra connections are opened and thrown away
         self.s3_client = boto3.client(
             's3',
             aws_access_key_id=self.s3_access_key,
             aws_secret_access_key=self.s3_secret_key,
             endpoint_url=self.s3_endpoint,
-            region_name=self.s3_region
+            region_name=self.s3_region,
+            config=BotoConfig(max_pool_connections=max(10, self.max_in_flight + self.s3_upload_workers))
         )
         
-        logger.info("Redis consumer initialized successfully")
+        self.compressor = PayloadCompressor(self.s3_compression, self.s3_compression_level)
+        
+        # Overlap S3 writes with API calls; a full queue blocks processing and so intake
+        self.upload_pool = None
+        if self.s3_upload_workers > 0:
+            self.upload_pool = S3UploadPool(self.s3_upload_workers, self.s3_upload_queue_depth)
+        
+        # Aggregate records into fewer, larger S3 objects when batching is enabled
+        self.s3_writer = None
+        if self.s3_batch_max_records > 1:
+            if self.s3_batch_max_age <= 0:
+                # The flusher checks batches every min(1s, S3_BATCH_MAX_AGE) and would spin
+                raise ValueError(f"S3_BATCH_MAX_AGE must be positive, got {self.s3_batch_max_age}")
+            self.s3_writer = S3BatchWriter(
+                self.s3_client,
+                self.s3_bucket,
+                self.generate_object_key,
+                max_records=self.s3_batch_max_records,
+                max_bytes=self.s3_batch_max_bytes,
+                max_age=self.s3_batch_max_age,
+                compressor=self.compressor,
+                upload_pool=self.upload_pool
+            )
+        
+        # Pooled keep-alive HTTP session for the detail view API
+        self.http_session = self._create_http_session()
+        # Coalesce identical links in flight at the same time; only possible when concurrent
+        self.single_flight = SingleFlight() if self.max_in_flight > 1 else None
+        self.concurrency_limiter = None
+        if self.adaptive_concurrency:
+            self.concurrency_limiter = ConcurrencyLimiter(self.create_adaptive_limit())
+        # Hedged requests need their own threads so the slow call can be raced
+        self.latency_tracker = None
+        self.hedge_budget = None
+        self.hedge_executor = None
+        if self.hedge_percentile > 0:
+            self.latency_tracker = LatencyTracker(
+                self.hedge_percentile, min_samples=self.hedge_min_samples, min_delay=self.hedge_min_delay
+            )
+            self.hedge_budget = HedgeBudget(self.hedge_budget_ratio, max_outstanding=self.hedge_max_outstanding)
+            self.hedge_executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight + self.hedge_headroom(),
+                thread_name_prefix='hedge'
+            )
+        self.circuit_breaker = None
+        if self.circuit_failure_threshold > 0:
+            self.circuit_breaker = CircuitBreaker(
+                'detail_view_api',
+                failure_threshold=self.circuit_failure_threshold,
+                reset_timeout=self.circuit_reset_timeout,
+                half_open_calls=self.circuit_half_open_calls
+            )
+        
+        # Intake statistics used to tune the batch size
+        self.intake_batches = 0
+        self.intake_messages = 0
+        self.intake_report_interval = int(os.getenv('INTAKE_REPORT_INTERVAL', 60))
+        # Prometheus-style metrics endpoint; unset or 0 disables it
+        self.metrics_port = int(os.getenv('METRICS_PORT', 0))
+        self.metrics_server = None
+        self._last_intake_report = time.monotonic()
+        
+        # In-flight tracking for concurrent mode; the semaphore is the hard cap
+        self._in_flight_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.executor = None
+        self.stopping = False
+        
+        self._register_metrics()
+        
+        logger.info(
+            f"Redis consumer initialized successfully (JSON codec: {codec.NAME}, Redis parser: {parser_name()}, "
+            f"Redis pool: {self.redis_pool.max_connections} connections)"
+        )
+
+    def redis_pool_options(self, max_connections: int = 0) -> Dict[str, Any]:
+        """Connection pool settings from the environment"""
+        # Intake, the retry mover, intake backend housekeeping and metrics scrapes each
+        # hold a connection on top of the message workers
+        default_size = self.max_in_flight + self.hedge_headroom() + 8
+        return pool_options(
+            self.redis_host,
+            self.redis_port,
+            self.redis_db,
+            self.redis_password,
+            max_connections=max_connections or self.redis_max_connections or default_size,
+            timeout=self.redis_pool_timeout,
+            health_check_interval=self.redis_health_check_interval,
+            socket_keepalive=self.redis_socket_keepalive
+        )
+
+    def configured_concurrency(self) -> int:
+        """Number of messages this engine processes at once"""
+        return max(1, int(os.getenv('MAX_IN_FLIGHT', 1)))
 
     def _validate_env_vars(self):
         """Validate that all required environment variables are set"""
@@ -73,121 +386,681 @@ class RedisConsumer:
 
     def is_valid_url(self, url: str) -> bool:
         """Validate if the provided string is a valid URL"""
+        return self.url_netloc(url) is not None
+
+    def url_netloc(self, url: str) -> Optional[str]:
+        """Lowercased host (and port) of a valid URL, or None if it is not one"""
         try:
             result = urlparse(url)
-            return all([result.scheme, result.netloc])
+            if not all([result.scheme, result.netloc]):
+                return None
+            result.port  # Raises ValueError for a port that is not a number in range
+            return result.netloc.lower()
         except:
-            return False
+            return None
+
+    def message_netloc(self, message_json: str) -> Optional[str]:
+        """Host a raw message's link points at; None for anything handle_message will reject"""
+        try:
+            message = codec.loads(message_json)
+        except ValueError:
+            return None
+        link = message.get('link') if isinstance(message, dict) else None
+        return self.url_netloc(link) if isinstance(link, str) else None
 
     def call_detail_view_api(self, url: str) -> Optional[Dict[str, Any]]:
-        """Call the detail view API with the provided URL"""
+        """Call the detail view API with the provided URL
+
+        With concurrent processing, messages for the same link that arrive
+        while its request is in flight share that request's response.
+        """
+        if self.single_flight is None:
+            return self._hedged_request(url)
+        return self.single_flight.do(normalize_url(url), lambda: self._hedged_request(url))
+
+    def hedge_headroom(self) -> int:
+        """Connections and threads to allow on top of max_in_flight for hedges and their losers"""
+        if self.hedge_percentile <= 0:
+            return 0
+        return self.hedge_max_outstanding
+
+    def _hedged_request(self, url: str) -> Optional[Dict[str, Any]]:
+        """Request the detail, racing a second request when the first is unusually slow"""
+        if self.latency_tracker is None:
+            return self._request_detail(url)
+        return hedged_call(
+            self.hedge_executor, lambda: self._request_detail(url), self.latency_tracker, self.hedge_budget,
+            refused=(CircuitOpen,)
+        )
+
+    def _request_detail(self, url: str) -> Optional[Dict[str, Any]]:
+        """POST one URL to the detail view API"""
         payload = {"url": url}
         
+        # Refuse outright while the API is considered down; the message goes back to the queue
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.acquire()
+        except BaseException:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.cancel_call()
+            raise
+        
+        status = 'error'
+        started = time.monotonic()
         try:
             logger.info(f"Calling detail view API for URL: {url}")
-            response = requests.post(
+            response = self.http_session.post(
                 self.detail_view_api,
-                json=payload,
+                data=codec.dumps(payload),
+                headers={'Content-Type': 'application/json'},
                 timeout=self.api_timeout
             )
+            status = str(response.status_code)
             response.raise_for_status()
-            return response.json()
+            return codec.loads(response.content)
         except requests.exceptions.Timeout:
+            status = 'timeout'
             logger.error(f"API request timed out for URL: {url}")
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"API request failed for URL {url}: {str(e)}")
             return None
         except json.JSONDecodeError as e:
+            metrics.JSON_DECODE_FAILURES.labels('api').inc()
             logger.error(f"Failed to parse API response for URL {url}: {str(e)}")
             return None
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.API_REQUEST_SECONDS.labels(status).observe(elapsed)
+            if self.latency_tracker is not None and status.startswith('2'):
+                self.latency_tracker.record(elapsed)
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.release(elapsed, is_overload(status))
+            if self.circuit_breaker is not None:
+                if is_overload(status):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+    def create_adaptive_limit(self) -> AdaptiveLimit:
+        """AIMD limit for API calls, bounded by API_CONCURRENCY_MIN/MAX (default 1 and MAX_IN_FLIGHT)"""
+        max_limit = int(os.getenv('API_CONCURRENCY_MAX', self.max_in_flight))
+        return AdaptiveLimit(
+            initial=int(os.getenv('API_CONCURRENCY_INITIAL', min(4, max_limit))),
+            min_limit=max(1, int(os.getenv('API_CONCURRENCY_MIN', 1))),
+            max_limit=max_limit,
+            backoff_ratio=self.api_backoff_ratio,
+            tolerance=self.api_latency_tolerance
+        )
+
+    def _create_http_session(self) -> requests.Session:
+        """Build a session whose connections are reused across messages"""
+        session = requests.Session()
+        # pool_block keeps concurrent callers waiting for a pooled connection
+        # instead of opening throwaway ones beyond the pool size
+        self.http_adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.http_pool_size,
+            pool_block=True,
+            max_retries=0
+        )
+        session.mount('http://', self.http_adapter)
+        session.mount('https://', self.http_adapter)
+        session.headers.update({'Connection': 'keep-alive'})
+        return session
+
+    def http_connection_stats(self) -> Dict[str, int]:
+        """Count new vs reused connections across the session's pools"""
+        new_connections = 0
+        total_requests = 0
+        pools = self.http_adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue  # Evicted while we were iterating
+            new_connections += pool.num_connections
+            total_requests += pool.num_requests
+        return {
+            'requests': total_requests,
+            'new_connections': new_connections,
+            'reused_connections': max(0, total_requests - new_connections)
+        }
+
+    def validate_message(self, message: Dict[str, Any]) -> bool:
+        """Check that the message carries a valid link"""
+        if 'link' not in message or not self.is_valid_url(message['link']):
+            logger.error(f"Invalid URL in message: {message.get('link', 'Missing')}")
+            return False
+        return True
+
+    def merge_api_response(self, message: Dict[str, Any], api_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the original message with the API response"""
+        return {**message, **api_response}
+
+    def generate_object_key(self, now: Optional[datetime] = None, extension: str = 'json') -> str:
+        """Build an S3 key inside a folder named after the given (default today's) date"""
+        now = now or datetime.now()
+        return f"{now.strftime('%Y-%m-%d')}/{now.strftime('%Y%m%d_%H%M%S_%f')}.{extension}"
+
+    def serialize_record(self, data: Dict[str, Any]) -> bytes:
+        """Convert combined data to the UTF-8 JSON stored in S3"""
+        return codec.dumps(data)
 
     def process_message(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Process a single message from Redis"""
         # Validate the URL
-        if 'link' not in message or not self.is_valid_url(message['link']):
-            logger.error(f"Invalid URL in message: {message.get('link', 'Missing')}")
-            return None
+        if not self.validate_message(message):
+            raise InvalidMessage(f"Invalid URL: {message.get('link', 'Missing')}")
         
-        # Call the detail view API
-        api_response = self.call_detail_view_api(message['link'])
+        # Skip links another message already covered within the dedup window
+        if self.dedup_filter is not None and self.dedup_filter.seen(message['link']):
+            cached = self.response_cache.get(message['link']) if self.dedup_action == 'merge' else None
+            if cached is None:
+                raise DuplicateMessage(message['link'])
+            return self.merge_api_response(message, cached)
+        
+        # Call the detail view API, unless the response is cached
+        api_response = self.get_detail(message['link'])
         if not api_response:
             return None
         
-        # Combine the original message with the API response
-        combined_data = {**message, **api_response}
-        return combined_data
+        # The link joins the dedup window in stored(), once the record is safely in S3
+        return self.merge_api_response(message, api_response)
+
+    def get_detail(self, url: str) -> Optional[Dict[str, Any]]:
+        """Detail view API response for the URL, served from the response cache when possible"""
+        if self.response_cache is not None:
+            cached = self.response_cache.get(url)
+            if cached is not None:
+                return cached
+        
+        api_response = self.call_detail_view_api(url)
+        if api_response and self.response_cache is not None:
+            self.response_cache.put(url, api_response)
+        return api_response
 
-    def store_in_s3(self, data: Dict[str, Any]) -> bool:
-        """Store the combined data in S3"""
-        # Create folder path based on today's date
-        today = datetime.now().strftime('%Y-%m-%d')
-        object_key = f"{today}/{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
+    def store_in_s3(self, data: Dict[str, Any], on_stored: Optional[Callable[[bool], None]] = None) -> bool:
+        """Store the combined data in S3
+
+        on_stored, if given, receives the final outcome once the upload has
+        actually finished, which may be later when uploads are buffered or
+        run in the background.
+        """
+        if self.s3_writer is not None:
+            try:
+                return self.s3_writer.add(self.serialize_record(data), on_stored)
+            except Exception as e:
+                logger.error(f"Failed to buffer data for S3: {str(e)}")
+                if on_stored is not None:
+                    on_stored(False)
+                return False
+        
+        object_key = self.generate_object_key(extension='json' + self.compressor.extension)
         
         try:
             # Convert data to JSON string
-            json_data = json.dumps(data, ensure_ascii=False)
+            json_data = self.serialize_record(data)
+        except Exception as e:
+            logger.error(f"Failed to store data in S3: {str(e)}")
+            if on_stored is not None:
+                on_stored(False)
+            return False
+        
+        if self.upload_pool is not None:
+            self.upload_pool.submit(lambda: self._upload_object(object_key, json_data), on_stored)
+            return True
+        stored = self._upload_object(object_key, json_data)
+        if on_stored is not None:
+            on_stored(stored)
+        return stored
+
+    def _upload_object(self, object_key: str, json_data: bytes) -> bool:
+        """Upload one serialized record, logging the outcome"""
+        try:
+            self.put_object(object_key, json_data)
             
-            # Upload to S3
+            logger.info(f"Successfully stored data in S3: {object_key}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to store data in S3: {str(e)}")
+            return False
+
+    def put_object(self, object_key: str, json_data: bytes):
+        """Compress (if configured) and upload a single JSON object"""
+        body = self.compressor.compress(json_data)
+        result = 'error'
+        started = time.monotonic()
+        try:
             self.s3_client.put_object(
                 Bucket=self.s3_bucket,
                 Key=object_key,
-                Body=json_data,
-                ContentType='application/json'
+                Body=body,
+                ContentType='application/json',
+                **self.compressor.put_kwargs()
             )
+            result = 'ok'
+            metrics.S3_PUT_BYTES.inc(len(body))
+        finally:
+            metrics.S3_PUT_SECONDS.labels(result).observe(time.monotonic() - started)
+
+    def fetch_batch(self, max_wait: Optional[float] = None) -> List[Tuple[str, Any]]:
+        """Pop up to queue_batch_size (message_json, receipt) pairs, blocking only while the queue is empty
+
+        The receipt is what the intake backend needs to acknowledge the
+        message; plain list intake has nothing to acknowledge and uses None.
+        An empty queue is waited on for max_wait seconds (default QUEUE_MAX_WAIT).
+        """
+        started = time.monotonic()
+        deadline = started + (self.queue_max_wait if max_wait is None else max_wait)
+        try:
+            while True:
+                messages = self._pop_batch(max(0.01, min(STOP_CHECK_INTERVAL, deadline - time.monotonic())))
+                if messages or self.stopping or time.monotonic() >= deadline:
+                    return messages
+        finally:
+            metrics.BLPOP_WAIT_SECONDS.observe(time.monotonic() - started)
+
+    def _pop_batch(self, max_wait: float) -> List[Tuple[str, Any]]:
+        if self.intake_backend is not None:
+            messages = self.intake_backend.fetch(self.queue_batch_size, max_wait)
+            if messages:
+                self._record_intake(len(messages))
+            return messages
+        
+        if self.queue_batch_size > 1:
+            # LPOP with a count drains several messages in a single round trip
+            messages = self.redis_client.lpop(self.queue_name, self.queue_batch_size)
+            if messages:
+                self._record_intake(len(messages))
+                return [(message, None) for message in messages]
+        
+        # Queue is empty (or batching is disabled), so block until a message arrives
+        # This allows multiple instances to work together
+        item = self.redis_client.blpop(self.queue_name, timeout=max_wait)
+        if not item:
+            return []
+        
+        messages = [item[1]]
+        if self.queue_batch_size > 1:
+            # Top up the batch with whatever arrived alongside the first message
+            messages.extend(self.redis_client.lpop(self.queue_name, self.queue_batch_size - 1) or [])
+        self._record_intake(len(messages))
+        return [(message, None) for message in messages]
+
+    def batch_fill_ratio(self) -> float:
+        """Average share of queue_batch_size filled by each intake round trip"""
+        if not self.intake_batches:
+            return 0.0
+        return self.intake_messages / (self.intake_batches * self.queue_batch_size)
+
+    def _record_intake(self, count: int):
+        """Track batch fill and periodically report it"""
+        self.intake_batches += 1
+        self.intake_messages += count
+        metrics.MESSAGES_FETCHED.inc(count)
+        metrics.BATCH_FILL_RATIO.set(self.batch_fill_ratio())
+        
+        now = time.monotonic()
+        if now - self._last_intake_report >= self.intake_report_interval:
+            logger.info(
+                f"Intake batch fill ratio: {self.batch_fill_ratio():.2f} "
+                f"({self.intake_messages} messages in {self.intake_batches} batches of up to {self.queue_batch_size}), "
+                f"in flight: {self.in_flight}/{self.max_in_flight} (peak {self.peak_in_flight})"
+            )
+            if self.upload_pool is not None:
+                upload_stats = self.upload_pool.stats()
+                logger.info(
+                    f"S3 uploads: {upload_stats['completed']} ok, {upload_stats['failed']} failed, "
+                    f"{upload_stats['queued']} queued, latency avg {upload_stats['latency_avg']:.3f}s "
+                    f"max {upload_stats['latency_max']:.3f}s, backpressure {upload_stats['backpressure_seconds']:.1f}s"
+                )
+            http_stats = self.http_connection_stats()
+            logger.info(
+                f"HTTP connections: {http_stats['new_connections']} new, "
+                f"{http_stats['reused_connections']} reused over {http_stats['requests']} requests"
+            )
+            self._last_intake_report = now
+
+    def decode_message(self, message_json: str) -> Dict[str, Any]:
+        """Parse a raw queue message, which must be a JSON object"""
+        message = codec.loads(message_json)
+        if not isinstance(message, dict):
+            logger.error(f"Message is not a JSON object: {message_json[:200]}")
+            raise InvalidMessage(f"Expected a JSON object, got {type(message).__name__}", 'invalid_message')
+        return message
+
+    def handle_message(self, message_json: str, receipt: Any = None):
+        """Decode, process and store a single raw message from the queue"""
+        try:
+            message = self.decode_message(message_json)
+            attempts = pop_attempts(message)
+            logger.info(f"Processing message: {message.get('name', 'Unknown')}")
             
-            logger.info(f"Successfully stored data in S3: {object_key}")
-            return True
+            # Process the message
+            combined_data = self.process_message(message)
+            
+            if combined_data:
+                # Store in S3; with an intake backend the message is settled once the upload finishes
+                stored = self.store_in_s3(combined_data, on_stored=lambda ok: self.stored(message, receipt, ok))
+                metrics.MESSAGES_PROCESSED.labels('stored' if stored else 'store_failed').inc()
+                return
+            
+            metrics.MESSAGES_PROCESSED.labels('failed').inc()
+            logger.warning(f"Failed to process message: {message.get('name', 'Unknown')}")
+            if not self.retry_later(message, attempts):
+                self.dead_letter(message_json, 'retries_exhausted', 'Detail view API call failed', attempts + 1)
+        
+        except InvalidMessage as e:
+            metrics.MESSAGES_PROCESSED.labels('invalid').inc()
+            self.dead_letter(message_json, e.reason, str(e))
+        except CircuitOpen as e:
+            metrics.MESSAGES_PROCESSED.labels('deferred').inc()
+            logger.warning(f"Returning message to the queue: {str(e)}")
+            self.defer(message_json, receipt)
+            return
+        except DuplicateMessage as e:
+            metrics.MESSAGES_PROCESSED.labels('duplicate').inc()
+            logger.info(f"Skipping link processed within the dedup window: {str(e)}")
+        except json.JSONDecodeError as e:
+            metrics.JSON_DECODE_FAILURES.labels('message').inc()
+            metrics.MESSAGES_PROCESSED.labels('invalid_json').inc()
+            logger.error(f"Failed to parse message as JSON: {str(e)}")
+            self.dead_letter(message_json, 'invalid_json', str(e))
         except Exception as e:
-            logger.error(f"Failed to store data in S3: {str(e)}")
+            metrics.MESSAGES_PROCESSED.labels('error').inc()
+            logger.error(f"Unexpected error processing message: {str(e)}")
+            self.dead_letter(message_json, 'unexpected_error', f"{type(e).__name__}: {str(e)}")
+        
+        # Messages that cannot be processed are dead-lettered (or dropped), as in list mode
+        self.settle(receipt, True)
+
+    def dead_letter(self, message_json: str, reason: str, error: str = '', attempts: int = 1):
+        """Keep a message the consumer is giving up on in the dead-letter queue"""
+        if self.dead_letters is not None:
+            self.dead_letters.add(message_json, reason, error, attempts)
+
+    def retry_later(self, message: Dict[str, Any], attempts: int) -> bool:
+        """Schedule a delayed retry of a failed message; False if it is given up on"""
+        if self.retry_queue is None:
             return False
+        try:
+            if self.retry_queue.schedule(message, attempts):
+                return True
+            logger.error(f"Giving up on message after {attempts + 1} attempts: {message.get('name', 'Unknown')}")
+        except Exception as e:
+            logger.error(f"Failed to schedule retry: {str(e)}")
+        return False
+
+    def defer(self, message_json: str, receipt: Any = None):
+        """Put a message that was not attempted back on the queue"""
+        if self.intake_backend is not None:
+            self.settle(receipt, False)
+            return
+        try:
+            # Head of the queue, so it is first in line once the API recovers
+            self.redis_client.lpush(self.queue_name, message_json)
+        except Exception as e:
+            logger.error(f"Failed to return message to the queue: {str(e)}")
+
+    def wait_for_circuit(self):
+        """Hold intake while the circuit breaker refuses API calls"""
+        if self.circuit_breaker is None:
+            return
+        paused = False
+        while not self.stopping:
+            delay = self.circuit_breaker.retry_after()
+            if delay <= 0:
+                break
+            if not paused:
+                logger.warning(f"Detail view API circuit is {self.circuit_breaker.state}; pausing intake")
+                paused = True
+            time.sleep(min(delay, 1.0))
+        if paused:
+            logger.info("Resuming intake")
+
+    def stored(self, message: Dict[str, Any], receipt: Any, ok: bool):
+        """Final outcome of a message's store: remember its link for the dedup window and settle it
+
+        A link only joins the window once its record is in S3, so a message
+        returned to the queue after a failed store is not skipped as a duplicate.
+        """
+        if ok and self.dedup_filter is not None:
+            self.dedup_filter.add(message['link'])
+        self.settle(receipt, ok)
+
+    def settle(self, receipt: Any, done: bool):
+        """Acknowledge a finished message, or return it to the queue if its store failed"""
+        if self.intake_backend is None:
+            return
+        try:
+            if done:
+                self.intake_backend.ack(receipt)
+            else:
+                self.intake_backend.requeue(receipt)
+        except Exception as e:
+            logger.error(f"Failed to settle message with the intake backend: {str(e)}")
+
+    def dispatch_batch(self, messages: List[Tuple[str, Any]]):
+        """Dispatch fetched messages in order; once a stop is requested the rest go back on the queue"""
+        for index, (message_json, receipt) in enumerate(messages):
+            if self.stopping:
+                logger.info(f"Returning {len(messages) - index} fetched messages to the queue")
+                self.return_to_queue(messages[index:])
+                return
+            self.dispatch(message_json, receipt)
+
+    def dispatch(self, message_json: str, receipt: Any = None, netloc: Optional[str] = None):
+        """Hand a message to the worker pool, blocking intake while max_in_flight is reached
+
+        netloc is the host slot the domain scheduler reserved for the
+        message; it is given back once the message is done.
+        """
+        if self.executor is None:
+            try:
+                self.handle_message(message_json, receipt)
+            finally:
+                self._release_domain(netloc)
+            return
+        
+        self._in_flight_slots.acquire()
+        with self._in_flight_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            self.executor.submit(self._handle_in_flight, message_json, receipt, netloc)
+        except Exception:
+            self._release_in_flight(netloc)
+            raise
+
+    def _handle_in_flight(self, message_json: str, receipt: Any, netloc: Optional[str] = None):
+        """Worker wrapper that frees the in-flight slot once the message is done"""
+        try:
+            self.handle_message(message_json, receipt)
+        finally:
+            self._release_in_flight(netloc)
+
+    def _release_in_flight(self, netloc: Optional[str] = None):
+        self._release_domain(netloc)
+        with self._in_flight_lock:
+            self.in_flight -= 1
+        self._in_flight_slots.release()
+
+    def _release_domain(self, netloc: Optional[str]):
+        if netloc is not None and self.domain_scheduler is not None:
+            self.domain_scheduler.limiter.release(netloc)
+
+    def dispatch_scheduled(self):
+        """Dispatch every held message whose host has a free slot, then top up the scheduler
+
+        The queue is only waited on for long when nothing is held back;
+        otherwise intake wakes up when the next throttled host frees up.
+        """
+        scheduler = self.domain_scheduler
+        while not self.stopping:
+            ready = scheduler.pop_ready()
+            if ready is None:
+                break
+            netloc, (message_json, receipt) = ready
+            self.dispatch(message_json, receipt, netloc)
+        if self.stopping:
+            return  # Whatever is still held goes back on the queue at shutdown
+        
+        max_wait = None
+        if len(scheduler):
+            ready_in = scheduler.next_ready_in()
+            # None means every held host is at its in-flight cap; poll for a release
+            max_wait = min(self.queue_max_wait, max(0.01, 0.05 if ready_in is None else ready_in))
+        if len(scheduler) >= self.domain_backlog:
+            time.sleep(max_wait)
+            return
+        for message_json, receipt in self.fetch_batch(max_wait):
+            scheduler.add(self.message_netloc(message_json), (message_json, receipt))
+
+    def return_scheduled(self):
+        """Put messages still held back by the domain scheduler back on the queue"""
+        if self.domain_scheduler is None:
+            return
+        held = self.domain_scheduler.drain()
+        if held:
+            logger.info(f"Returning {len(held)} messages held for throttled hosts to the queue")
+        self.return_to_queue(held)
+
+    def return_to_queue(self, messages: List[Tuple[str, Any]]):
+        """Give back fetched (message_json, receipt) pairs that were never dispatched, keeping their order"""
+        # List mode pushes each one to the head, so go backwards; intake backends requeue at the tail
+        for message_json, receipt in (messages if self.intake_backend is not None else reversed(messages)):
+            self.defer(message_json, receipt)
+
+    def queue_depth(self) -> int:
+        """Number of messages waiting in the queue (undelivered entries in stream mode)"""
+        if self.intake_mode == 'stream':
+            return self.intake_backend.lag()['lag']
+        return self.redis_client.llen(self.queue_name)
+
+    def _register_metrics(self):
+        """Point scrape-time gauges at this consumer's state"""
+        for state in ('in_use', 'idle'):
+            metrics.REDIS_POOL_CONNECTIONS.labels(self.redis_pool.name, state).set_function(
+                lambda state=state: self.redis_pool.stats()[state]
+            )
+        metrics.MAX_IN_FLIGHT.set(self.max_in_flight)
+        metrics.IN_FLIGHT.set_function(lambda: self.in_flight)
+        metrics.QUEUE_DEPTH.set_function(self.queue_depth)
+        if self.response_cache is not None:
+            metrics.RESPONSE_CACHE_ENTRIES.set_function(lambda: len(self.response_cache))
+        if self.retry_queue is not None:
+            metrics.RETRY_PENDING.set_function(self.retry_queue.size)
+        if self.dead_letters is not None:
+            metrics.DEAD_LETTER_DEPTH.set_function(self.dead_letters.size)
+        if self.dedup_filter is not None:
+            for stat in ('fill_ratio', 'false_positive_rate', 'memory_bytes'):
+                metrics.DEDUP_FILTER.labels(stat).set_function(lambda stat=stat: self.dedup_filter.stats()[stat])
+        if self.domain_scheduler is not None:
+            metrics.DOMAINS_TRACKED.set_function(lambda: len(self.domain_scheduler.limiter))
+        if self.intake_mode == 'stream':
+            metrics.STREAM_PENDING.set_function(lambda: self.intake_backend.lag()['pending'])
+        metrics.HTTP_CONNECTIONS.labels('new').set_function(lambda: self.http_connection_stats()['new_connections'])
+        metrics.HTTP_CONNECTIONS.labels('reused').set_function(lambda: self.http_connection_stats()['reused_connections'])
+        if self.upload_pool is not None:
+            metrics.S3_UPLOAD_QUEUE.set_function(lambda: self.upload_pool.stats()['queued'])
+
+    def start_workers(self):
+        """Start message processing and the background helpers"""
+        self.start_processing()
+        if self.upload_pool is not None:
+            self.upload_pool.start()
+        if self.s3_writer is not None:
+            self.s3_writer.start()
+        if self.intake_backend is not None:
+            self.intake_backend.start()
+        if self.retry_queue is not None:
+            self.retry_queue.start()
+        if self.metrics_port and self.metrics_server is None:
+            self.metrics_server = metrics.start_metrics_server(self.metrics_port)
+
+    def start_processing(self):
+        """Create the worker pool used by dispatch when concurrency is enabled"""
+        if self.max_in_flight > 1 and self.executor is None:
+            # Messages overlap and finish out of order; intake pauses while all slots are busy
+            self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='consumer')
+
+    def stop_processing(self):
+        """Wait for every dispatched message to finish"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def shutdown(self):
+        """Finish in-flight messages and flush buffered S3 records"""
+        logger.info("Shutting down consumer...")
+        self.return_scheduled()
+        self.stop_processing()
+        if self.hedge_executor is not None:
+            # Only abandoned hedge losers can still be running; nobody waits for them
+            self.hedge_executor.shutdown(wait=False)
+        if self.s3_writer is not None:
+            self.s3_writer.close()
+        if self.upload_pool is not None:
+            self.upload_pool.close()
+        if self.intake_backend is not None:
+            self.intake_backend.close()
+        if self.retry_queue is not None:
+            self.retry_queue.close()
+        logger.info("Consumer shut down cleanly")
 
     def run(self):
         """Main loop to process messages from Redis"""
-        logger.info(f"Starting consumer for queue: {self.queue_name}")
+        logger.info(
+            f"Starting consumer for queue: {self.queue_name} "
+            f"(batch size {self.queue_batch_size}, max in flight {self.max_in_flight})"
+        )
+        self.start_workers()
+        # Docker stops containers with SIGTERM; stop intake between messages so nothing fetched is lost
+        signal.signal(signal.SIGTERM, self.stop)
         
-        while True:
-            try:
-                # Use BLPOP to block until a message is available
-                # This allows multiple instances to work together
-                _, message_json = self.redis_client.blpop(self.queue_name, timeout=30)
+        try:
+            while not self.stopping:
+                try:
+                    self.wait_for_circuit()
+                    if self.domain_scheduler is not None:
+                        self.dispatch_scheduled()
+                        continue
+                    self.dispatch_batch(self.fetch_batch())
                 
-                if message_json:
-                    try:
-                        message = json.loads(message_json)
-                        logger.info(f"Processing message: {message.get('name', 'Unknown')}")
-                        
-                        # Process the message
-                        combined_data = self.process_message(message)
-                        
-                        if combined_data:
-                            # Store in S3
-                            self.store_in_s3(combined_data)
-                        else:
-                            logger.warning(f"Failed to process message: {message.get('name', 'Unknown')}")
-                    
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse message as JSON: {str(e)}")
-                    except Exception as e:
-                        logger.error(f"Unexpected error processing message: {str(e)}")
-            
-            except redis.exceptions.ConnectionError:
-                logger.error("Redis connection error. Attempting to reconnect...")
-                self._reconnect_redis()
-            except Exception as e:
-                logger.error(f"Unexpected error in main loop: {str(e)}")
-                # Add a small delay to prevent tight loops on errors
-                time.sleep(1)
+                except PoolExhausted as e:
+                    # Workers hold every connection; Redis is reachable, so just wait for one again
+                    logger.warning(f"Redis pool exhausted, retrying intake: {str(e)}")
+                except redis.exceptions.ConnectionError:
+                    logger.error("Redis connection error. Attempting to reconnect...")
+                    self._reconnect_redis()
+                except Exception as e:
+                    logger.error(f"Unexpected error in main loop: {str(e)}")
+                    # Add a small delay to prevent tight loops on errors
+                    time.sleep(1)
+            logger.info("Stop requested, no longer fetching messages")
+        finally:
+            self.shutdown()
+
+    def stop(self, signum=None, frame=None):
+        """Ask run() to stop fetching; dispatched messages are finished by shutdown()"""
+        self.stopping = True
 
     def _reconnect_redis(self):
-        """Reconnect to Redis in case of connection issues"""
+        """Reconnect to Redis in case of connection issues
+
+        The pool (and the client every helper holds) stays; only its idle
+        connections are dropped, and fresh ones are opened on demand with
+        the same settings and credentials. Connections other threads are
+        using are left to them; a broken one is replaced when its command fails.
+        """
         try:
-            self.redis_client = redis.Redis(
-                host=self.redis_host,
-                port=self.redis_port,
-                db=self.redis_db,
-                decode_responses=True
-            )
+            self.redis_pool.disconnect(inuse_connections=False)
             # Test the connection
             self.redis_client.ping()
             logger.info("Redis reconnected successfully")
@@ -195,17 +1068,35 @@ class RedisConsumer:
             logger.error(f"Failed to reconnect to Redis: {str(e)}")
             time.sleep(5)  # Wait before retrying
 
-if __name__ == "__main__":
-    # Load environment variables from .env file if it exists
+def load_env():
+    """Load environment variables from .env file if it exists"""
     try:
         from dotenv import load_dotenv
         load_dotenv()
         logger.info("Loaded environment variables from .env file")
     except ImportError:
         pass  # dotenv not installed
-    
-    try:
+
+
+def run_consumer():
+    """Run the engine CONSUMER_ENGINE selects, synchronous (default), threaded or asyncio, until it exits"""
+    engine = os.getenv('CONSUMER_ENGINE', 'sync').lower()
+    if engine == 'async':
+        import asyncio
+        from async_consumer import AsyncRedisConsumer
+        asyncio.run(AsyncRedisConsumer().run())
+    elif engine == 'threaded':
+        from threaded_consumer import ThreadedRedisConsumer
+        ThreadedRedisConsumer().run()
+    else:
         consumer = RedisConsumer()
         consumer.run()
+
+
+if __name__ == "__main__":
+    load_env()
+    
+    try:
+        run_consumer()
     except Exception as e:
         logger.error(f"Failed to initialize consumer: {str(e)}")
@@ -0,0 +1,320 @@
+"""Minimal Prometheus-style metrics for the consumer
+
+Metrics are module-level objects so any module can record into them; the
+text exposition format is served by start_metrics_server() when
+METRICS_PORT is set. Recording is cheap enough to leave on unconditionally.
+"""
+import re
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values) -> '_Metric':
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                self._children[key] = child
+            return child
+
+    def _new_child(self) -> '_Metric':
+        child = object.__new__(type(self))
+        child._lock = threading.Lock()
+        child._init_value()
+        return child
+
+    def _init_value(self):
+        raise NotImplementedError
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], '_Metric']]:
+        if self.labelnames:
+            with self._lock:
+                return sorted(self._children.items())
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in self._series():
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _init_value(self):
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+    def _samples(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self._value)}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _init_value(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value at scrape time instead of storing it"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self._value
+
+    def _samples(self, name, labelnames, values):
+        try:
+            value = self.get()
+        except Exception as e:
+            logger.warning(f"Failed to collect metric {name}: {str(e)}")
+            return []
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _new_child(self) -> '_Metric':
+        child = object.__new__(type(self))
+        child._lock = threading.Lock()
+        child._buckets = self._buckets
+        child._init_value()
+        return child
+
+    def _init_value(self):
+        self._counts = [0] * len(self._buckets)
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def _samples(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._buckets, counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}')
+        lines.append(f'{name}_count{_format_labels(labelnames, values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self, names: Optional[Sequence[str]] = None) -> str:
+        """Text exposition of every metric, or only of the named ones"""
+        with self._lock:
+            metrics = [metric for metric in self._metrics if names is None or metric.name in names]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# Redis connection pool
+REDIS_POOL_WAIT_SECONDS = Histogram('consumer_redis_pool_wait_seconds', 'Time spent getting a connection from the Redis pool', ['pool'],
+                                    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 20))
+REDIS_POOL_CONNECTIONS = Gauge('consumer_redis_pool_connections', 'Redis pool connections by state', ['pool', 'state'])
+REDIS_POOL_EXHAUSTED = Counter('consumer_redis_pool_exhausted_total', 'Times no Redis pool connection freed up within REDIS_POOL_TIMEOUT', ['pool'])
+
+# Intake
+BLPOP_WAIT_SECONDS = Histogram('consumer_blpop_wait_seconds', 'Time spent waiting on Redis intake per round trip')
+MESSAGES_FETCHED = Counter('consumer_messages_fetched_total', 'Messages popped from the queue')
+BATCH_FILL_RATIO = Gauge('consumer_batch_fill_ratio', 'Average share of the intake batch size filled per round trip')
+QUEUE_DEPTH = Gauge('consumer_queue_depth', 'Messages waiting in the Redis queue (LLEN)')
+JSON_DECODE_FAILURES = Counter('consumer_json_decode_failures_total', 'Payloads that failed to parse as JSON', ['source'])
+
+# Reliable intake
+RELIABLE_ACKS = Counter('consumer_reliable_acks_total', 'Messages acknowledged and removed from the processing list')
+RELIABLE_REQUEUED = Counter('consumer_reliable_requeued_total', 'Messages returned to the queue (or left pending) after a failed store')
+RELIABLE_REAPED = Counter('consumer_reliable_reaped_total', 'Messages recovered from dead workers or reclaimed stream entries')
+RETRIES = Counter('consumer_retries_total', 'Delayed retries, by event (scheduled, promoted, exhausted)', ['event'])
+RETRY_PENDING = Gauge('consumer_retry_pending', 'Messages waiting in the retry sorted set')
+DEAD_LETTERED = Counter('consumer_dead_lettered_total', 'Messages moved to the dead-letter queue, by reason', ['reason'])
+DEAD_LETTER_DEPTH = Gauge('consumer_dead_letter_depth', 'Entries in the dead-letter queue')
+STREAM_PENDING = Gauge('consumer_stream_pending', 'Stream entries delivered to the group but not yet acknowledged')
+
+# Processing
+IN_FLIGHT = Gauge('consumer_in_flight', 'Messages currently being processed')
+MAX_IN_FLIGHT = Gauge('consumer_max_in_flight', 'Configured cap on messages processed at once')
+WORK_QUEUE_DEPTH = Gauge('consumer_work_queue_depth', 'Fetched messages waiting for a worker thread (threaded engine)')
+MESSAGES_PROCESSED = Counter('consumer_messages_processed_total', 'Messages finished, by outcome', ['result'])
+
+# Detail view API
+API_REQUEST_SECONDS = Histogram('consumer_api_request_seconds', 'Detail view API call duration', ['status'])
+HTTP_CONNECTIONS = Gauge('consumer_http_connections', 'Detail view API requests by connection reuse', ['kind'])
+API_CONCURRENCY_LIMIT = Gauge('consumer_api_concurrency_limit', 'Current adaptive cap on concurrent detail view API calls')
+CIRCUIT_STATE = Gauge('consumer_circuit_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open', ['circuit'])
+CIRCUIT_TRANSITIONS = Counter('consumer_circuit_transitions_total', 'Circuit breaker state changes, by new state', ['circuit', 'state'])
+RATE_LIMIT_TOKENS = Counter('consumer_rate_limit_tokens_total', 'Cluster rate limit calls: granted from Redis, expired unspent, unlimited while Redis failed', ['result'])
+RATE_LIMIT_WAIT_SECONDS = Counter('consumer_rate_limit_wait_seconds_total', 'Time API calls spent waiting for the cluster rate limit')
+DOMAIN_BACKLOG = Gauge('consumer_domain_backlog', 'Fetched messages waiting for a throttled origin host')
+DOMAINS_TRACKED = Gauge('consumer_domains_tracked', 'Origin hosts with per-domain limiter state')
+API_HEDGES = Counter('consumer_api_hedges_total', 'Hedged detail view requests: sent, won (hedge first), lost, refused (sent but blocked by the circuit breaker), over_budget', ['result'])
+API_HEDGE_DELAY = Gauge('consumer_api_hedge_delay_seconds', 'Current latency after which a hedge request is sent')
+API_COALESCED = Counter('consumer_api_coalesced_total', 'Detail view API calls served by an identical request already in flight')
+RESPONSE_CACHE_REQUESTS = Counter('consumer_response_cache_requests_total', 'Response cache lookups, by outcome', ['result'])
+RESPONSE_CACHE_EVICTIONS = Counter('consumer_response_cache_evictions_total', 'Entries evicted from the in-process response cache')
+DEDUP_FILTER = Gauge('consumer_dedup_filter', 'Dedup Bloom filter fill ratio, estimated false-positive rate and memory bytes', ['stat'])
+RESPONSE_CACHE_ENTRIES = Gauge('consumer_response_cache_entries', 'Entries held in the in-process response cache')
+
+# S3
+S3_PUT_SECONDS = Histogram('consumer_s3_put_seconds', 'S3 put_object duration', ['result'])
+S3_PUT_BYTES = Counter('consumer_s3_put_bytes_total', 'Bytes uploaded to S3')
+S3_UPLOAD_QUEUE = Gauge('consumer_s3_upload_queue', 'Uploads waiting in the background upload pool')
+
+
+# Supervisor
+WORKERS = Gauge('consumer_workers', 'Worker processes alive under the supervisor')
+WORKER_RESTARTS = Counter('consumer_worker_restarts_total', 'Worker processes restarted after exiting')
+SUPERVISOR_METRICS = ('consumer_workers', 'consumer_worker_restarts_total')
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?(\s.*)$')
+
+
+def _add_label(sample: str, label: str) -> str:
+    match = _SAMPLE.match(sample)
+    if match is None:
+        return sample
+    name, labels, rest = match.groups()
+    inner = labels[1:-1] if labels else ''
+    return f"{name}{{{label}{',' + inner if inner else ''}}}{rest}"
+
+
+def merge_expositions(texts: Dict[str, str], label: str = 'worker', skip: Sequence[str] = ()) -> str:
+    """Combine several processes' /metrics output into one, telling them apart by a label
+
+    Samples keep their values; each family's HELP and TYPE lines appear
+    once, ahead of the samples of every process. Families named in skip
+    are dropped.
+    """
+    families: Dict[str, List[str]] = {}
+    for source, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                family = line.split(' ', 3)[2]
+                if family not in skip:
+                    headers = families.setdefault(family, [])
+                    if line not in headers:
+                        headers.append(line)
+            elif line and family is not None and family not in skip:
+                families[family].append(_add_label(line, f'{label}="{source}"'))
+    lines = [line for family in families.values() for line in family]
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0',
+                         render: Callable[[], str] = REGISTRY.render) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; port 0 picks a free port (see server.server_address)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.render = render
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics endpoint listening on {host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Optional, Tuple
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# GCRA over the Redis clock, in microseconds: KEYS[1] holds the theoretical
+# arrival time (TAT) of the next call. Grants up to ARGV[3] calls at once and
+# returns {granted, microseconds to wait when none were granted}.
+TAKE_TOKENS = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or 0)
+if tat < now then
+    tat = now
+end
+local granted = math.min(tonumber(ARGV[3]), math.floor((now + tolerance - tat) / interval))
+if granted > 0 then
+    tat = tat + granted * interval
+    redis.call('SET', KEYS[1], string.format('%d', tat), 'PX', math.ceil((tat - now) / 1000) + 1)
+    return {granted, 0}
+end
+return {0, math.ceil(tat + interval - tolerance - now)}
+"""
+
+
+class ClusterRateLimiter:
+    """Detail view API call rate shared by every consumer instance
+
+    The limit lives in Redis as a GCRA key, so instances need no other
+    coordination and a restart loses nothing. Calls are taken from Redis
+    in batches of up to `prefetch` and spent locally, so most calls cost no
+    round trip; the batch follows local demand over the last `token_ttl`
+    seconds, and unspent tokens expire after that long so an idle
+    instance cannot hoard the shared rate. If Redis is unreachable the
+    limiter lets calls through rather than stalling the consumer.
+    """
+
+    def __init__(self, redis_client: Any, key: str, rate: float, burst: float = 0.0,
+                 prefetch: int = 10, token_ttl: float = 1.0):
+        self.redis_client = redis_client
+        self.key = key
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.prefetch = max(1, prefetch)
+        self.token_ttl = token_ttl
+
+        self._take_tokens = redis_client.register_script(TAKE_TOKENS)
+        self._tokens = 0
+        self._expires_at = 0.0
+        self._blocked_until = 0.0
+        self._window_started = time.monotonic()
+        self._demand = 0
+        self._last_demand = 1
+        self._failing = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the cluster-wide rate allows one more call"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._take_local()
+                if wait is None:
+                    wait = self._refill(*self._fetch())
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.RATE_LIMIT_WAIT_SECONDS.inc(waited)
+
+    def _take_local(self) -> Optional[float]:
+        """Spend a prefetched token: 0 on success, seconds to wait, or None if Redis must be asked"""
+        now = time.monotonic()
+        if now - self._window_started >= self.token_ttl:
+            self._last_demand = self._demand
+            self._demand = 0
+            self._window_started = now
+        if self._tokens and now >= self._expires_at:
+            metrics.RATE_LIMIT_TOKENS.labels('expired').inc(self._tokens)
+            self._tokens = 0
+        if self._tokens:
+            self._tokens -= 1
+            self._demand += 1
+            return 0.0
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        return None
+
+    def _refill(self, granted: int, wait_us: int) -> float:
+        now = time.monotonic()
+        if granted:
+            self._tokens = granted - 1
+            self._expires_at = now + self.token_ttl
+            self._demand += 1
+            return 0.0
+        self._blocked_until = now + wait_us / 1000000
+        return self._blocked_until - now
+
+    def _fetch(self) -> Tuple[int, int]:
+        """Ask Redis for a batch of calls sized to recent local demand"""
+        wanted = min(self.prefetch, max(1, self._last_demand, self._demand))
+        interval = 1000000 / self.rate
+        try:
+            granted, wait_us = self._take_tokens(
+                keys=[self.key], args=[interval, interval * self.burst, wanted], client=self.redis_client
+            )
+        except Exception as e:
+            if not self._failing:
+                logger.error(f"Cluster rate limiter unavailable, letting calls through: {str(e)}")
+                self._failing = True
+            metrics.RATE_LIMIT_TOKENS.labels('unlimited').inc()
+            return 1, 0
+        if self._failing:
+            logger.info("Cluster rate limiter available again")
+            self._failing = False
+        metrics.RATE_LIMIT_TOKENS.labels('granted').inc(int(granted))
+        return int(granted), int(wait_us)
+
+
+class AsyncClusterRateLimiter(ClusterRateLimiter):
+    """ClusterRateLimiter for the asyncio engine; Redis refills run on a worker thread"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._async_lock = asyncio.Lock()
+
+    async def acquire(self):
+        waited = 0.0
+        while True:
+            async with self._async_lock:
+                wait = self._take_local()
+                if wait is None:
+                    wait = self._refill(*await asyncio.to_thread(self._fetch))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.RATE_LIMIT_WAIT_SECONDS.inc(waited)
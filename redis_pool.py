@@ -0,0 +1,98 @@
+import time
+import logging
+from typing import Any, Dict
+
+import redis
+import redis.asyncio as aioredis
+from redis.utils import HIREDIS_AVAILABLE
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(redis.exceptions.ConnectionError):
+    """Every pooled connection stayed busy for the whole pool timeout; Redis itself may be fine"""
+
+
+def _exhausted(pool: Any, error: Exception) -> Exception:
+    """PoolExhausted for redis-py's pool timeout error, the error itself for anything else"""
+    if str(error).startswith('No connection available'):
+        metrics.REDIS_POOL_EXHAUSTED.labels(pool.name).inc()
+        return PoolExhausted(f"No {pool.name} Redis connection freed up within {pool.timeout}s")
+    return error
+
+
+class ConnectionPool(redis.BlockingConnectionPool):
+    """Blocking Redis connection pool that records how long callers wait for a connection
+
+    At max_connections, callers wait up to `timeout` seconds for one to be
+    returned instead of opening more, then get PoolExhausted.
+    """
+
+    def __init__(self, name: str = 'sync', **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+
+    def get_connection(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            return super().get_connection(*args, **kwargs)
+        except redis.exceptions.ConnectionError as e:
+            raise _exhausted(self, e) from e
+        finally:
+            metrics.REDIS_POOL_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, int]:
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        return {'in_use': len(self._connections) - idle, 'idle': idle, 'max': self.max_connections}
+
+
+class AsyncConnectionPool(aioredis.BlockingConnectionPool):
+    """ConnectionPool for redis.asyncio clients"""
+
+    def __init__(self, name: str = 'async', **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        except redis.exceptions.ConnectionError as e:
+            raise _exhausted(self, e) from e
+        finally:
+            metrics.REDIS_POOL_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, int]:
+        in_use = len(self._in_use_connections)
+        return {'in_use': in_use, 'idle': len(self._available_connections), 'max': self.max_connections}
+
+
+def pool_options(host: str, port: int, db: int, password: Any, max_connections: int,
+                 timeout: float = 20.0, health_check_interval: int = 30,
+                 socket_keepalive: bool = True, socket_connect_timeout: float = 5.0) -> Dict[str, Any]:
+    """Connection settings shared by the sync and async pools
+
+    health_check_interval PINGs a connection that sat idle longer than
+    that before reusing it, so a connection dropped by a proxy or failover
+    is replaced instead of failing the next command. redis-py picks the
+    hiredis reply parser by itself when the hiredis package is installed.
+    """
+    return {
+        'host': host,
+        'port': port,
+        'db': db,
+        'password': password,
+        'decode_responses': True,
+        'max_connections': max_connections,
+        'timeout': timeout,
+        'health_check_interval': health_check_interval,
+        'socket_keepalive': socket_keepalive,
+        'socket_connect_timeout': socket_connect_timeout,
+    }
+
+
+def parser_name() -> str:
+    return 'hiredis' if HIREDIS_AVAILABLE else 'python'
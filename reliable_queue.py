@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+from typing import Any, List, Tuple
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+class ReliableQueue:
+    """At-least-once intake from a Redis list
+
+    Messages are moved atomically (LMOVE/BLMOVE) from the queue into a
+    per-worker processing list and only removed from it once acknowledged,
+    so a crash mid-message leaves it recoverable. A heartbeat key marks the
+    worker as alive; the reaper returns the processing lists of workers whose
+    heartbeat expired to the head of the queue. Acknowledgements are
+    buffered and removed in pipelined batches.
+    """
+
+    def __init__(self, redis_client: Any, queue_name: str, worker_id: str,
+                 ack_batch_size: int = 50, ack_interval: float = 1.0,
+                 heartbeat_ttl: int = 30, reaper_interval: float = 30.0):
+        self.redis_client = redis_client
+        self.queue_name = queue_name
+        self.worker_id = worker_id
+        self.processing_name = f"{queue_name}:processing:{worker_id}"
+        self.heartbeat_key = f"{queue_name}:heartbeat:{worker_id}"
+        self.workers_key = f"{queue_name}:workers"
+
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        self.reaper_interval = reaper_interval
+
+        self._acks: List[str] = []
+        self._ack_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Register the worker, recover its own leftovers and start housekeeping"""
+        self._heartbeat()
+        recovered = self._requeue_list(self.processing_name)
+        if recovered:
+            logger.warning(f"Requeued {recovered} unacknowledged messages from a previous run of {self.worker_id}")
+        self._thread = threading.Thread(target=self._housekeeping, name='reliable-queue', daemon=True)
+        self._thread.start()
+
+    def fetch(self, batch_size: int, timeout: float) -> List[Tuple[str, str]]:
+        """Move up to batch_size messages into the processing list, blocking only while the queue is empty
+
+        Returns (message_json, receipt) pairs; the receipt is the message itself,
+        which is what LREM needs to acknowledge it.
+        """
+        messages = self._move(batch_size) if batch_size > 1 else []
+        if not messages:
+            first = self.redis_client.blmove(self.queue_name, self.processing_name, timeout, 'LEFT', 'RIGHT')
+            if first is None:
+                return []
+            messages = [first]
+            if batch_size > 1:
+                messages.extend(self._move(batch_size - 1))
+        return [(message, message) for message in messages]
+
+    def ack(self, message_json: str):
+        """Mark a message as done; it is removed with the next ack batch"""
+        with self._ack_lock:
+            self._acks.append(message_json)
+            flush = len(self._acks) >= self.ack_batch_size
+        if flush:
+            self.flush_acks()
+
+    def requeue(self, message_json: str):
+        """Return a message to the back of the queue right away"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lrem(self.processing_name, 1, message_json)
+        pipe.rpush(self.queue_name, message_json)
+        pipe.execute()
+        metrics.RELIABLE_REQUEUED.inc()
+
+    def flush_acks(self):
+        """Remove acknowledged messages from the processing list in one round trip"""
+        with self._ack_lock:
+            acks, self._acks = self._acks, []
+        if not acks:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for message_json in acks:
+                pipe.lrem(self.processing_name, 1, message_json)
+            pipe.execute()
+            metrics.RELIABLE_ACKS.inc(len(acks))
+        except Exception as e:
+            # Keep them for the next attempt; at worst they are processed twice
+            with self._ack_lock:
+                self._acks[:0] = acks
+            logger.error(f"Failed to acknowledge {len(acks)} messages: {str(e)}")
+
+    def reap(self) -> int:
+        """Requeue in-flight messages of workers whose heartbeat has expired"""
+        requeued = 0
+        for worker_id in self.redis_client.smembers(self.workers_key):
+            if worker_id == self.worker_id or self.redis_client.exists(f"{self.queue_name}:heartbeat:{worker_id}"):
+                continue
+            count = self._requeue_list(f"{self.queue_name}:processing:{worker_id}")
+            self.redis_client.srem(self.workers_key, worker_id)
+            if count:
+                logger.warning(f"Requeued {count} stale messages from dead worker {worker_id}")
+            requeued += count
+        metrics.RELIABLE_REAPED.inc(requeued)
+        return requeued
+
+    def close(self):
+        """Flush acknowledgements, return anything unfinished and deregister"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_acks()
+        leftover = self._requeue_list(self.processing_name)
+        if leftover:
+            logger.warning(f"Requeued {leftover} unfinished messages on shutdown")
+        self.redis_client.delete(self.heartbeat_key)
+        self.redis_client.srem(self.workers_key, self.worker_id)
+
+    def _move(self, count: int) -> List[str]:
+        # LMOVE has no count, so pipeline several to keep it to one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        for _ in range(count):
+            pipe.lmove(self.queue_name, self.processing_name, 'LEFT', 'RIGHT')
+        return [message for message in pipe.execute() if message is not None]
+
+    def _requeue_list(self, processing_name: str) -> int:
+        # Oldest items end up back at the head of the queue, in their original order
+        count = 0
+        while self.redis_client.lmove(processing_name, self.queue_name, 'RIGHT', 'LEFT') is not None:
+            count += 1
+        return count
+
+    def _heartbeat(self):
+        # Re-registering every time puts a live worker back in the set if a reaper dropped it
+        # while its heartbeat had lapsed, e.g. during a Redis outage
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(self.heartbeat_key, int(time.time()), ex=self.heartbeat_ttl)
+        pipe.sadd(self.workers_key, self.worker_id)
+        pipe.execute()
+
+    def _housekeeping(self):
+        next_heartbeat = next_reap = time.monotonic()
+        while not self._stop.wait(self.ack_interval):
+            try:
+                self.flush_acks()
+                now = time.monotonic()
+                if now >= next_heartbeat:
+                    self._heartbeat()
+                    next_heartbeat = now + self.heartbeat_ttl / 3
+                if now >= next_reap:
+                    self.reap()
+                    next_reap = now + self.reaper_interval
+            except Exception as e:
+                logger.error(f"Reliable queue housekeeping failed: {str(e)}")
@@ -0,0 +1,125 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import codec
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a link so trivially different spellings share a cache entry
+
+    Lowercases the scheme and host, drops default ports and the fragment,
+    sorts query parameters and turns an empty path into '/'.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else '')
+        host = f"{userinfo}@{host}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class ResponseCache:
+    """Two-tier cache of detail view API responses keyed by normalized URL
+
+    The first tier is an in-process LRU bounded to max_entries; the second,
+    when a Redis client is given, is shared by every worker and expires
+    entries after ttl seconds. Local entries expire on the same schedule so
+    a worker never serves something the shared tier has already dropped.
+    Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, redis_client: Any = None, max_entries: int = 10000, ttl: float = 3600,
+                 key_prefix: str = 'detail_cache:'):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Look the URL up locally, then in Redis; shared hits are kept locally"""
+        value = self.get_local(url)
+        if value is None and self.redis_client is not None:
+            value = self.get_shared(url)
+        return value
+
+    def get_local(self, url: str) -> Optional[Dict[str, Any]]:
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            if self.redis_client is None:
+                metrics.RESPONSE_CACHE_REQUESTS.labels('miss').inc()
+            return None
+        metrics.RESPONSE_CACHE_REQUESTS.labels('local_hit').inc()
+        return entry[1]
+
+    def get_shared(self, url: str) -> Optional[Dict[str, Any]]:
+        key = normalize_url(url)
+        try:
+            raw = self.redis_client.get(self._redis_key(key))
+            if raw is None:
+                metrics.RESPONSE_CACHE_REQUESTS.labels('miss').inc()
+                return None
+            value = codec.loads(raw)
+        except Exception as e:
+            metrics.RESPONSE_CACHE_REQUESTS.labels('error').inc()
+            logger.error(f"Failed to read response cache for URL {url}: {str(e)}")
+            return None
+
+        metrics.RESPONSE_CACHE_REQUESTS.labels('shared_hit').inc()
+        self._store_local(key, value)
+        return value
+
+    def put(self, url: str, value: Dict[str, Any]):
+        """Cache a successful API response in both tiers"""
+        key = normalize_url(url)
+        self._store_local(key, value)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(self._redis_key(key), codec.dumps(value), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            logger.error(f"Failed to write response cache for URL {url}: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store_local(self, key: str, value: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.RESPONSE_CACHE_EVICTIONS.inc(evicted)
+
+    def _redis_key(self, key: str) -> str:
+        # Hash so arbitrarily long URLs make fixed-size keys
+        return self.key_prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
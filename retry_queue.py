@@ -0,0 +1,124 @@
+import time
+import uuid
+import random
+import logging
+import threading
+from typing import Any, Dict
+
+import codec
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Metadata carried inside a retried message; stripped again before processing
+RETRY_FIELD = '_retry'
+
+# Move due members to the tail of the list in one atomic step, so several
+# workers can run the mover without pushing anything twice
+PROMOTE_TO_LIST = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('RPUSH', KEYS[2], unpack(due))
+end
+return #due
+"""
+
+PROMOTE_TO_STREAM = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    for _, message in ipairs(due) do
+        redis.call('XADD', KEYS[2], '*', 'message', message)
+    end
+end
+return #due
+"""
+
+
+def pop_attempts(message: Dict[str, Any]) -> int:
+    """Remove the retry metadata from a decoded message and return its attempt count"""
+    state = message.pop(RETRY_FIELD, None)
+    return int(state.get('attempts', 0)) if isinstance(state, dict) else 0
+
+
+class RetryQueue:
+    """Delayed retries in a Redis sorted set scored by next-attempt time
+
+    Failed messages are scheduled with exponential backoff and equal
+    jitter (half the delay fixed, half random) and carry their attempt
+    count in a '_retry' field. A background mover promotes due messages
+    back to the queue (a list, or a stream in stream mode) in bulk with a
+    Lua script, so retries never sleep on a processing thread.
+    """
+
+    def __init__(self, redis_client: Any, retry_key: str, target: str, target_type: str = 'list',
+                 max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 300.0,
+                 move_interval: float = 1.0, batch_size: int = 500):
+        self.redis_client = redis_client
+        self.retry_key = retry_key
+        self.target = target
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.move_interval = move_interval
+        self.batch_size = batch_size
+
+        self._promote = redis_client.register_script(PROMOTE_TO_STREAM if target_type == 'stream' else PROMOTE_TO_LIST)
+        self._random = random.Random()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before the given retry attempt (1-based)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + self._random.uniform(0, delay / 2)
+
+    def schedule(self, message: Dict[str, Any], attempts: int) -> bool:
+        """Schedule another attempt; False once max_attempts have been used up"""
+        attempt = attempts + 1
+        if attempt >= self.max_attempts:
+            metrics.RETRIES.labels('exhausted').inc()
+            return False
+
+        delay = self.backoff(attempt)
+        # The id keeps identical messages from collapsing into one member
+        member = codec.dumps({**message, RETRY_FIELD: {'attempts': attempt, 'id': uuid.uuid4().hex}})
+        self.redis_client.zadd(self.retry_key, {member: time.time() + delay})
+        metrics.RETRIES.labels('scheduled').inc()
+        logger.info(f"Scheduled retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s for {message.get('link')}")
+        return True
+
+    def promote_due(self) -> int:
+        """Move every due retry back to the queue, batch_size at a time"""
+        moved = 0
+        while True:
+            count = int(self._promote(keys=[self.retry_key, self.target], args=[time.time(), self.batch_size],
+                                      client=self.redis_client))
+            moved += count
+            if count < self.batch_size:
+                break
+        if moved:
+            metrics.RETRIES.labels('promoted').inc(moved)
+        return moved
+
+    def size(self) -> int:
+        return self.redis_client.zcard(self.retry_key)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._mover, name='retry-mover', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _mover(self):
+        while not self._stop.wait(self.move_interval):
+            try:
+                self.promote_due()
+            except Exception as e:
+                logger.error(f"Failed to promote due retries: {str(e)}")
@@ -0,0 +1,297 @@
+import gzip
+import time
+import queue
+import logging
+import threading
+
+import metrics
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstd compression unavailable
+
+class PayloadCompressor:
+    """Compresses S3 object bodies and tracks CPU cost against bytes saved
+
+    codec is 'none', 'gzip' or 'zstd'; level None picks the codec's default.
+    """
+
+    EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, codec: str = 'none', level: Optional[int] = None):
+        codec = (codec or 'none').lower()
+        if codec not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported S3 compression: {codec}")
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("S3 compression 'zstd' requires the zstandard package")
+
+        self.codec = codec
+        self.level = level
+        self.extension = self.EXTENSIONS[codec]
+        self._local = threading.local()  # zstd compressors are not thread-safe
+        self._lock = threading.Lock()
+
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def put_kwargs(self) -> Dict[str, str]:
+        """Extra put_object arguments describing the encoding"""
+        return {'ContentEncoding': self.codec} if self.codec != 'none' else {}
+
+    def compress(self, body: bytes) -> bytes:
+        if self.codec == 'none':
+            return body
+
+        started = time.thread_time()
+        if self.codec == 'gzip':
+            compressed = gzip.compress(body, compresslevel=self.level if self.level is not None else 6)
+        else:
+            compressor = getattr(self._local, 'zstd', None)
+            if compressor is None:
+                compressor = zstandard.ZstdCompressor(level=self.level if self.level is not None else 3)
+                self._local.zstd = compressor
+            compressed = compressor.compress(body)
+        elapsed = time.thread_time() - started
+
+        with self._lock:
+            self.raw_bytes += len(body)
+            self.compressed_bytes += len(compressed)
+            self.cpu_seconds += elapsed
+        return compressed
+
+    def ratio(self) -> float:
+        """Compressed size as a share of the raw size"""
+        return self.compressed_bytes / self.raw_bytes if self.raw_bytes else 1.0
+
+class S3UploadPool:
+    """Bounded pool of threads running S3 uploads in the background
+
+    submit() blocks while queue_depth uploads are already waiting, which
+    pushes back on message processing and, through it, on Redis intake.
+    Each upload is a callable returning True on success.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        # Upload statistics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.backpressure_seconds = 0.0
+
+    def start(self):
+        """Start the upload threads"""
+        for i in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._worker, name=f's3-upload-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, upload: Callable[[], bool], callback: Optional[Callable[[bool], None]] = None):
+        """Queue an upload, blocking while the pool is saturated"""
+        started = time.monotonic()
+        self._queue.put((upload, callback))
+        waited = time.monotonic() - started
+        with self._lock:
+            self.submitted += 1
+            self.backpressure_seconds += waited
+
+    def close(self):
+        """Wait for queued uploads to finish and stop the threads"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                'queued': self._queue.qsize(),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'latency_avg': self.latency_total / finished if finished else 0.0,
+                'latency_max': self.latency_max,
+                'backpressure_seconds': self.backpressure_seconds
+            }
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            upload, callback = item
+
+            started = time.monotonic()
+            try:
+                succeeded = bool(upload())
+            except Exception as e:
+                logger.error(f"Unexpected error in S3 upload: {str(e)}")
+                succeeded = False
+            elapsed = time.monotonic() - started
+
+            with self._lock:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+
+            if callback is not None:
+                try:
+                    callback(succeeded)
+                except Exception as e:
+                    logger.error(f"S3 upload callback failed: {str(e)}")
+
+class S3BatchWriter:
+    """Buffers serialized records and uploads them as newline-delimited JSON objects
+
+    A batch is flushed when it reaches max_records, max_bytes or max_age
+    seconds, when the date changes (so every object stays under its own
+    YYYY-MM-DD/ prefix) and on close(). With an upload_pool, flushed
+    batches are uploaded in the background. Each record may carry a
+    callback that receives the outcome of the upload containing it.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key_factory: Callable[[datetime, str], str],
+                 max_records: int, max_bytes: int, max_age: float,
+                 compressor: Optional[PayloadCompressor] = None,
+                 upload_pool: Optional[S3UploadPool] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key_factory = key_factory
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compressor = compressor or PayloadCompressor()
+        self.upload_pool = upload_pool
+
+        self._lock = threading.Lock()
+        self._records: List[bytes] = []
+        self._callbacks: List[Callable[[bool], None]] = []
+        self._bytes = 0
+        self._opened_at = 0.0
+        self._opened_dt: Optional[datetime] = None
+
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        # Flush statistics
+        self.objects_written = 0
+        self.records_written = 0
+        self.bytes_written = 0
+
+    def start(self):
+        """Start the background thread that enforces max_age"""
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='s3-batch-flusher', daemon=True)
+            self._flusher.start()
+
+    def add(self, record: bytes, callback: Optional[Callable[[bool], None]] = None) -> bool:
+        """Buffer a record, uploading any batch that became due"""
+        now = datetime.now()
+        batches = []
+        with self._lock:
+            if self._records and now.date() != self._opened_dt.date():
+                batches.append(self._take())
+            if not self._records:
+                self._opened_at = time.monotonic()
+                self._opened_dt = now
+            self._records.append(record)
+            if callback is not None:
+                self._callbacks.append(callback)
+            self._bytes += len(record) + 1
+            if len(self._records) >= self.max_records or self._bytes >= self.max_bytes:
+                batches.append(self._take())
+
+        results = [self._dispatch(batch) for batch in batches]
+        return all(results)
+
+    def flush(self) -> bool:
+        """Upload whatever is buffered right now"""
+        with self._lock:
+            batch = self._take() if self._records else None
+        return self._dispatch(batch) if batch else True
+
+    def close(self):
+        """Stop the background flusher and upload the remaining records"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def _take(self):
+        batch = (self._records, self._opened_dt, self._callbacks)
+        self._records = []
+        self._callbacks = []
+        self._bytes = 0
+        self._opened_dt = None
+        return batch
+
+    def _flush_loop(self):
+        interval = min(1.0, self.max_age)
+        while not self._stop.wait(interval):
+            with self._lock:
+                expired = self._records and time.monotonic() - self._opened_at >= self.max_age
+                batch = self._take() if expired else None
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch) -> bool:
+        if self.upload_pool is not None:
+            self.upload_pool.submit(lambda: self._upload(*batch))
+            return True
+        return self._upload(*batch)
+
+    def _upload(self, records: List[bytes], opened_dt: datetime,
+                 callbacks: List[Callable[[bool], None]]) -> bool:
+        succeeded = self._put_batch(records, opened_dt)
+        for callback in callbacks:
+            try:
+                callback(succeeded)
+            except Exception as e:
+                logger.error(f"S3 batch callback failed: {str(e)}")
+        return succeeded
+
+    def _put_batch(self, records: List[bytes], opened_dt: datetime) -> bool:
+        object_key = self.key_factory(opened_dt, 'jsonl' + self.compressor.extension)
+
+        started = time.monotonic()
+        try:
+            body = self.compressor.compress(b'\n'.join(records) + b'\n')
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=object_key,
+                Body=body,
+                ContentType='application/x-ndjson',
+                **self.compressor.put_kwargs()
+            )
+        except Exception as e:
+            metrics.S3_PUT_SECONDS.labels('error').observe(time.monotonic() - started)
+            logger.error(f"Failed to store batch of {len(records)} records in S3: {str(e)}")
+            return False
+        metrics.S3_PUT_SECONDS.labels('ok').observe(time.monotonic() - started)
+        metrics.S3_PUT_BYTES.inc(len(body))
+
+        with self._lock:
+            self.objects_written += 1
+            self.records_written += len(records)
+            self.bytes_written += len(body)
+        logger.info(f"Successfully stored {len(records)} records in S3: {object_key}")
+        return True
@@ -0,0 +1,935 @@
+"""Local stand-ins for Redis, the detail view API and S3
+
+Used by benchmark.py to drive the real consumer process entirely offline.
+Each stand-in listens on 127.0.0.1 and runs on daemon threads.
+"""
+import gzip
+import json
+import hashlib
+import math
+import time
+import random
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstd-encoded uploads cannot be inspected
+
+try:
+    from lupa import lua51
+except ImportError:
+    lua51 = None  # EVAL/EVALSHA unavailable; pip install lupa to enable them
+
+
+def _serve(server) -> None:
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+# ---------------------------------------------------------------------------
+# Redis
+
+class _RespError(Exception):
+    pass
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    """Speaks enough RESP2/RESP3 for redis-py's list-queue commands"""
+
+    # Replies to pipelined commands go out one write each; Nagle would hold them back
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.resp3 = False
+        self.transaction = None
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, OSError):
+                return
+            if command is None:
+                return
+            try:
+                name = command[0].upper()
+                if name == b'HELLO':
+                    reply = self._hello(command[1:])
+                elif name == b'MULTI':
+                    self.transaction = []
+                    reply = True
+                elif name == b'EXEC':
+                    commands, self.transaction = self.transaction or [], None
+                    reply = self.server.execute_all(commands)
+                elif name == b'DISCARD':
+                    self.transaction = None
+                    reply = True
+                elif self.transaction is not None:
+                    self.transaction.append(command)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.server.execute(command)
+            except _RespError as e:
+                reply = e
+            except Exception as e:
+                reply = _RespError(f'ERR {e}')
+            try:
+                self.wfile.write(self._encode(reply))
+                self.wfile.flush()
+            except (ConnectionError, OSError):
+                return
+
+    def _hello(self, args: List[bytes]) -> Any:
+        protocol = int(args[0]) if args else 2
+        if protocol not in (2, 3):
+            raise _RespError('NOPROTO unsupported protocol version')
+        self.resp3 = protocol == 3
+        return Map({b'server': b'redis', b'version': b'7.2.0', b'proto': protocol, b'mode': b'standalone'})
+
+    def _read_line(self) -> Optional[bytes]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        return line.rstrip(b'\r\n')
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        header = self._read_line()
+        if header is None:
+            return None
+        if not header.startswith(b'*'):
+            return header.split()  # Inline command, e.g. from redis-cli
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self._read_line()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _encode(self, value: Any) -> bytes:
+        if isinstance(value, _RespError):
+            return f'-{value}\r\n'.encode()
+        if value is True:
+            return b'+OK\r\n'
+        if isinstance(value, str):
+            return f'+{value}\r\n'.encode()
+        if isinstance(value, int):
+            return f':{value}\r\n'.encode()
+        if isinstance(value, bytes):
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        if isinstance(value, KeyedReply) and not self.resp3:
+            return self._encode([[key, item] for key, item in value.items()])
+        if isinstance(value, Map):
+            if not self.resp3:
+                return self._encode([item for pair in value.items() for item in pair])
+            return b'%%%d\r\n' % len(value) + b''.join(
+                self._encode(key) + self._encode(item) for key, item in value.items()
+            )
+        if self.resp3 and (value is None or isinstance(value, NullArray)):
+            return b'_\r\n'
+        if isinstance(value, NullArray):
+            return b'*-1\r\n'
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, (list, tuple)):
+            return b'*%d\r\n' % len(value) + b''.join(self._encode(item) for item in value)
+        raise TypeError(f'Cannot encode {type(value)}')
+
+
+class Map(dict):
+    """RESP3 map (flattened to an array for RESP2 clients)"""
+
+
+def _lua_arg(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).encode()
+
+
+class KeyedReply(Map):
+    """XREAD-style reply: a RESP3 map, or an array of [key, value] pairs for RESP2"""
+
+
+class NullArray:
+    """RESP nil array, returned by BLPOP on timeout and LPOP count on an empty list"""
+
+
+class MiniRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory Redis stand-in for list queues
+
+    Supports connection setup, MULTI/EXEC, the list commands used by the
+    list and reliable intake modes (RPUSH, LPUSH, LPOP [count], BLPOP, LMOVE,
+    BLMOVE, LREM, LLEN, LRANGE, LTRIM), plain keys with expiry (SET EX/PX, GET, EXPIRE, EXISTS, DEL), TIME,
+    bitmaps (SETBIT, GETBIT, BITCOUNT, STRLEN), sorted sets (ZADD, ZREM, ZCARD,
+    ZRANGEBYSCORE), Lua scripting through lupa (EVAL, EVALSHA, SCRIPT LOAD),
+    sets (SADD, SREM, SMEMBERS) and the consumer-group subset of streams
+    (XADD, XLEN, XGROUP CREATE, XREADGROUP, XACK, XAUTOCLAIM, XINFO GROUPS).
+    For modes that need more of Redis, point the benchmark at a real server
+    instead.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(('127.0.0.1', port), _RedisHandler)
+        self.lists: Dict[bytes, deque] = {}
+        self.strings: Dict[bytes, tuple] = {}
+        self.sets: Dict[bytes, set] = {}
+        self.streams: Dict[bytes, '_Stream'] = {}
+        self.zsets: Dict[bytes, Dict[bytes, float]] = {}
+        self.scripts: Dict[bytes, bytes] = {}
+        self._lua = None
+        self.changed = threading.Condition()  # Reentrant, so scripts can call back into execute()
+        self.commands = 0
+        _serve(self)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def push(self, key: str, *values: str):
+        """Append values directly, bypassing the network"""
+        self.execute([b'RPUSH', key.encode()] + [value.encode() for value in values])
+
+    def xadd(self, key: str, *values: str, field: str = 'message'):
+        """Append one stream entry per value, bypassing the network"""
+        for value in values:
+            self.execute([b'XADD', key.encode(), b'*', field.encode(), value.encode()])
+
+    def execute(self, command: List[bytes]) -> Any:
+        name = command[0].upper().decode()
+        args = command[1:]
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            raise _RespError(f"ERR unknown command '{name}'")
+        with self.changed:
+            self.commands += 1
+            return handler(*args)
+
+    def execute_all(self, commands: List[List[bytes]]) -> List[Any]:
+        with self.changed:
+            replies = []
+            for command in commands:
+                try:
+                    replies.append(self.execute(command))
+                except _RespError as e:
+                    replies.append(e)
+            return replies
+
+    def _cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def _cmd_time(self):
+        now = time.time()
+        return [str(int(now)).encode(), str(int(now % 1 * 1000000)).encode()]
+
+    def _cmd_auth(self, *args):
+        return True
+
+    def _cmd_select(self, *args):
+        return True
+
+    def _cmd_client(self, *args):
+        return True
+
+    def _cmd_flushdb(self, *args):
+        self.lists.clear()
+        self.strings.clear()
+        self.sets.clear()
+        self.streams.clear()
+        self.zsets.clear()
+        return True
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            for store in (self.lists, self.strings, self.sets, self.streams, self.zsets):
+                if store.pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+    def _live_string(self, key):
+        entry = self.strings.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.strings[key]
+            return None
+        return entry
+
+    def _cmd_set(self, key, value, *options):
+        expires_at = None
+        options = [option.upper() for option in options]
+        if b'EX' in options:
+            expires_at = time.monotonic() + int(options[options.index(b'EX') + 1])
+        elif b'PX' in options:
+            expires_at = time.monotonic() + int(options[options.index(b'PX') + 1]) / 1000
+        self.strings[key] = (value, expires_at)
+        return True
+
+    def _cmd_get(self, key):
+        entry = self._live_string(key)
+        return bytes(entry[0]) if entry else None
+
+    def _cmd_expire(self, key, seconds):
+        entry = self._live_string(key)
+        if not entry:
+            return 0
+        self.strings[key] = (entry[0], time.monotonic() + int(seconds))
+        return 1
+
+    def _cmd_strlen(self, key):
+        entry = self._live_string(key)
+        return len(entry[0]) if entry else 0
+
+    def _cmd_setbit(self, key, offset, value):
+        offset = int(offset)
+        entry = self._live_string(key)
+        # Bitmaps are kept as mutable bytearrays so each SETBIT does not copy them
+        bitmap = entry[0] if entry and isinstance(entry[0], bytearray) else bytearray(entry[0] if entry else b'')
+        expires_at = entry[1] if entry else None
+        index, mask = offset // 8, 0x80 >> (offset % 8)
+        if index >= len(bitmap):
+            bitmap.extend(bytes(index + 1 - len(bitmap)))
+        previous = 1 if bitmap[index] & mask else 0
+        if value == b'1':
+            bitmap[index] |= mask
+        else:
+            bitmap[index] &= ~mask
+        self.strings[key] = (bitmap, expires_at)
+        return previous
+
+    def _cmd_getbit(self, key, offset):
+        offset = int(offset)
+        entry = self._live_string(key)
+        if not entry or offset // 8 >= len(entry[0]):
+            return 0
+        return 1 if entry[0][offset // 8] & (0x80 >> (offset % 8)) else 0
+
+    def _cmd_bitcount(self, key):
+        entry = self._live_string(key)
+        return int.from_bytes(entry[0], 'big').bit_count() if entry else 0
+
+    def _cmd_zadd(self, key, *args):
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def _cmd_zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        removed = sum(1 for member in members if zset.pop(member, None) is not None)
+        if not zset:
+            self.zsets.pop(key, None)
+        return removed
+
+    def _cmd_zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def _cmd_zrangebyscore(self, key, low, high, *options):
+        def bound(value, infinite):
+            if value in (b'-inf', b'+inf', b'inf'):
+                return infinite if value != b'-inf' else -math.inf
+            return float(value.lstrip(b'('))
+        low_value, high_value = bound(low, math.inf), bound(high, math.inf)
+        members = sorted((score, member) for member, score in self.zsets.get(key, {}).items())
+        matched = [
+            (member, score) for score, member in members
+            if (score > low_value if low.startswith(b'(') else score >= low_value)
+            and (score < high_value if high.startswith(b'(') else score <= high_value)
+        ]
+        upper = [option.upper() for option in options]
+        if b'LIMIT' in upper:
+            offset, count = (int(value) for value in options[upper.index(b'LIMIT') + 1:upper.index(b'LIMIT') + 3])
+            matched = matched[offset:] if count < 0 else matched[offset:offset + count]
+        if b'WITHSCORES' in upper:
+            return [item for member, score in matched for item in (member, repr(score).encode())]
+        return [member for member, _ in matched]
+
+    def _cmd_script(self, subcommand, *args):
+        subcommand = subcommand.upper()
+        if subcommand == b'LOAD':
+            sha = hashlib.sha1(args[0]).hexdigest().encode()
+            self.scripts[sha] = args[0]
+            return sha
+        if subcommand == b'EXISTS':
+            return [1 if sha.lower() in self.scripts else 0 for sha in args]
+        if subcommand == b'FLUSH':
+            self.scripts.clear()
+            return True
+        raise _RespError(f'ERR unknown SCRIPT subcommand {subcommand.decode()}')
+
+    def _cmd_evalsha(self, sha, numkeys, *args):
+        source = self.scripts.get(sha.lower())
+        if source is None:
+            raise _RespError('NOSCRIPT No matching script. Please use EVAL.')
+        return self._run_script(source, int(numkeys), args)
+
+    def _cmd_eval(self, source, numkeys, *args):
+        self.scripts[hashlib.sha1(source).hexdigest().encode()] = source
+        return self._run_script(source, int(numkeys), args)
+
+    def _run_script(self, source: bytes, numkeys: int, args) -> Any:
+        if lua51 is None:
+            raise _RespError('ERR scripting needs the lupa package in the stand-in')
+        if self._lua is None:
+            self._lua = lua51.LuaRuntime(encoding=None, unpack_returned_tuples=False)
+        lua = self._lua
+        lua.globals().KEYS = lua.table_from(list(args[:numkeys]))
+        lua.globals().ARGV = lua.table_from(list(args[numkeys:]))
+        lua.globals().redis = lua.table_from({
+            b'call': lambda *command: self._to_lua(self.execute([_lua_arg(arg) for arg in command])),
+            b'error_reply': lambda message: lua.table_from({b'err': message}),
+            b'status_reply': lambda message: lua.table_from({b'ok': message}),
+        })
+        try:
+            result = lua.execute(source)
+        except lua51.LuaError as e:
+            raise _RespError(f'ERR Error running script: {e}')
+        return self._from_lua(result)
+
+    def _to_lua(self, value: Any) -> Any:
+        # Redis-to-Lua conversion rules: nil bulk/array -> false, status -> {ok=...}
+        if value is None or isinstance(value, NullArray):
+            return False
+        if value is True:
+            return self._lua.table_from({b'ok': b'OK'})
+        if isinstance(value, str):
+            return self._lua.table_from({b'ok': value.encode()})
+        if isinstance(value, (list, tuple)):
+            return self._lua.table_from([self._to_lua(item) for item in value])
+        return value
+
+    def _from_lua(self, value: Any) -> Any:
+        # Lua-to-Redis: numbers truncate to integers, false -> nil, tables -> arrays
+        if value is None or value is False:
+            return None
+        if value is True:
+            return 1
+        if isinstance(value, float):
+            return int(value)
+        if lua51.lua_type(value) == 'table':
+            if value[b'err'] is not None:
+                raise _RespError(value[b'err'].decode())
+            if value[b'ok'] is not None:
+                return value[b'ok'].decode()
+            items = []
+            for index in range(1, len(value) + 1):
+                items.append(self._from_lua(value[index]))
+            return items
+        return value
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._live_string(key) or self.lists.get(key) or self.sets.get(key))
+
+    def _cmd_sadd(self, key, *members):
+        members_set = self.sets.setdefault(key, set())
+        before = len(members_set)
+        members_set.update(members)
+        return len(members_set) - before
+
+    def _cmd_srem(self, key, *members):
+        members_set = self.sets.get(key, set())
+        removed = sum(1 for member in members if member in members_set)
+        members_set.difference_update(members)
+        return removed
+
+    def _cmd_smembers(self, key):
+        return sorted(self.sets.get(key, ()))
+
+    def _cmd_llen(self, key):
+        return len(self.lists.get(key, ()))
+
+    def _cmd_lrange(self, key, start, stop):
+        items = list(self.lists.get(key, ()))
+        start, stop = int(start), int(stop)
+        stop = len(items) if stop == -1 else stop + 1 if stop >= 0 else len(items) + stop + 1
+        return items[start:stop]
+
+    def _cmd_ltrim(self, key, start, stop):
+        kept = self._cmd_lrange(key, start, stop)
+        if kept:
+            self.lists[key] = deque(kept)
+        else:
+            self.lists.pop(key, None)
+        return True
+
+    def _cmd_rpush(self, key, *values):
+        items = self.lists.setdefault(key, deque())
+        items.extend(values)
+        self.changed.notify_all()
+        return len(items)
+
+    def _cmd_lpush(self, key, *values):
+        items = self.lists.setdefault(key, deque())
+        items.extendleft(values)
+        self.changed.notify_all()
+        return len(items)
+
+    def _cmd_lpop(self, key, count=None):
+        items = self.lists.get(key)
+        if count is None:
+            return items.popleft() if items else None
+        if not items:
+            return NullArray()
+        return [items.popleft() for _ in range(min(int(count), len(items)))]
+
+    def _cmd_lrem(self, key, count, value):
+        items = self.lists.get(key)
+        if not items:
+            return 0
+        count = int(count)
+        limit = abs(count) or len(items)
+        order = list(items) if count >= 0 else list(reversed(items))
+        kept, removed = [], 0
+        for item in order:
+            if item == value and removed < limit:
+                removed += 1
+            else:
+                kept.append(item)
+        self.lists[key] = deque(kept if count >= 0 else reversed(kept))
+        return removed
+
+    def _cmd_lmove(self, source, destination, where_from, where_to):
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.popleft() if where_from.upper() == b'LEFT' else items.pop()
+        target = self.lists.setdefault(destination, deque())
+        if where_to.upper() == b'LEFT':
+            target.appendleft(value)
+        else:
+            target.append(value)
+        self.changed.notify_all()
+        return value
+
+    def _cmd_blmove(self, source, destination, where_from, where_to, timeout):
+        deadline = time.monotonic() + float(timeout) if float(timeout) else None
+        while not self.lists.get(source):
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                return None
+            self.changed.wait(remaining)
+        return self._cmd_lmove(source, destination, where_from, where_to)
+
+    def _stream(self, key, create: bool = False) -> '_Stream':
+        stream = self.streams.get(key)
+        if stream is None:
+            if not create:
+                raise _RespError('ERR no such key')
+            stream = self.streams[key] = _Stream()
+        return stream
+
+    def _cmd_xadd(self, key, *args):
+        args = list(args)
+        while args[0].upper() in (b'MAXLEN', b'MINID', b'NOMKSTREAM', b'=', b'~'):
+            option = args.pop(0).upper()
+            if option in (b'MAXLEN', b'MINID'):
+                if args[0] in (b'=', b'~'):
+                    args.pop(0)
+                args.pop(0)
+        entry_id, fields = args[0], args[1:]
+        stream = self._stream(key, create=True)
+        stream.last_id = _Stream.next_id(stream.last_id) if entry_id == b'*' else _Stream.parse_id(entry_id)
+        stream.entries.append((stream.last_id, list(fields)))
+        self.changed.notify_all()
+        return _Stream.format_id(stream.last_id)
+
+    def _cmd_xlen(self, key):
+        stream = self.streams.get(key)
+        return len(stream.entries) if stream else 0
+
+    def _cmd_xgroup(self, subcommand, key, group, *args):
+        if subcommand.upper() != b'CREATE':
+            raise _RespError('ERR only XGROUP CREATE is supported')
+        stream = self._stream(key, create=b'MKSTREAM' in [arg.upper() for arg in args])
+        if group in stream.groups:
+            raise _RespError('BUSYGROUP Consumer Group name already exists')
+        start = stream.last_id if args[0] == b'$' else _Stream.parse_id(args[0])
+        stream.groups[group] = {'last': start, 'pending': {}}
+        return True
+
+    def _cmd_xreadgroup(self, *args):
+        args = list(args)
+        upper = [arg.upper() for arg in args]
+        group, consumer = args[upper.index(b'GROUP') + 1], args[upper.index(b'GROUP') + 2]
+        count = int(args[upper.index(b'COUNT') + 1]) if b'COUNT' in upper else None
+        block = int(args[upper.index(b'BLOCK') + 1]) if b'BLOCK' in upper else None
+        streams_at = upper.index(b'STREAMS')
+        key, start = args[streams_at + 1], args[streams_at + 2]
+
+        stream = self._stream(key)
+        state = stream.groups.get(group)
+        if state is None:
+            raise _RespError('NOGROUP No such consumer group')
+
+        if start != b'>':
+            # Re-read this consumer's own pending entries
+            since = _Stream.parse_id(start)
+            ids = sorted(entry_id for entry_id, (owner, _, _) in state['pending'].items()
+                         if owner == consumer and entry_id > since)[:count]
+            entries = stream.lookup(ids)
+            return KeyedReply({key: [[_Stream.format_id(i), f] for i, f in entries]})
+
+        deadline = time.monotonic() + block / 1000 if block else None
+        while True:
+            fresh = [entry for entry in stream.entries if entry[0] > state['last']][:count]
+            if fresh:
+                break
+            if block is None:
+                return NullArray()
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                return NullArray()
+            self.changed.wait(remaining)
+
+        now = time.monotonic()
+        for entry_id, _ in fresh:
+            state['pending'][entry_id] = (consumer, now, 1)
+        state['last'] = fresh[-1][0]
+        return KeyedReply({key: [[_Stream.format_id(i), f] for i, f in fresh]})
+
+    def _cmd_xack(self, key, group, *ids):
+        state = self._stream(key).groups.get(group, {'pending': {}})
+        return sum(1 for entry_id in ids if state['pending'].pop(_Stream.parse_id(entry_id), None))
+
+    def _cmd_xautoclaim(self, key, group, consumer, min_idle, start, *args):
+        upper = [arg.upper() for arg in args]
+        count = int(args[upper.index(b'COUNT') + 1]) if b'COUNT' in upper else 100
+        stream = self._stream(key)
+        state = stream.groups[group]
+        now = time.monotonic()
+        since = _Stream.parse_id(start)
+        candidates = sorted(
+            entry_id for entry_id, (_, delivered_at, _) in state['pending'].items()
+            if entry_id >= since and (now - delivered_at) * 1000 >= int(min_idle)
+        )
+        claimed, rest = candidates[:count], candidates[count:]
+        for entry_id in claimed:
+            _, _, deliveries = state['pending'][entry_id]
+            state['pending'][entry_id] = (consumer, now, deliveries + 1)
+        entries = stream.lookup(claimed)
+        cursor = _Stream.format_id(rest[0]) if rest else b'0-0'
+        return [cursor, [[_Stream.format_id(i), f] for i, f in entries], []]
+
+    def _cmd_xinfo(self, subcommand, key):
+        if subcommand.upper() != b'GROUPS':
+            raise _RespError('ERR only XINFO GROUPS is supported')
+        stream = self._stream(key)
+        groups = []
+        for name, state in stream.groups.items():
+            consumers = {owner for owner, _, _ in state['pending'].values()}
+            lag = sum(1 for entry_id, _ in stream.entries if entry_id > state['last'])
+            groups.append(Map({
+                b'name': name,
+                b'consumers': len(consumers),
+                b'pending': len(state['pending']),
+                b'last-delivered-id': _Stream.format_id(state['last']),
+                b'lag': lag,
+            }))
+        return groups
+
+    def _cmd_blpop(self, *args):
+        keys, timeout = args[:-1], float(args[-1])
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            for key in keys:
+                if self.lists.get(key):
+                    return [key, self.lists[key].popleft()]
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                return NullArray()
+            self.changed.wait(remaining)
+
+
+class _Stream:
+    """Append-only entries plus consumer-group state; ids are (ms, seq) tuples"""
+
+    def __init__(self):
+        self.entries: List[tuple] = []
+        self.last_id = (0, 0)
+        self.groups: Dict[bytes, Dict[str, Any]] = {}
+
+    @staticmethod
+    def parse_id(value: bytes) -> tuple:
+        if value in (b'-', b'0'):
+            return (0, 0)
+        ms, _, seq = value.partition(b'-')
+        return (int(ms), int(seq or 0))
+
+    @staticmethod
+    def format_id(entry_id: tuple) -> bytes:
+        return b'%d-%d' % entry_id
+
+    @staticmethod
+    def next_id(last: tuple) -> tuple:
+        ms = int(time.time() * 1000)
+        return (ms, 0) if ms > last[0] else (last[0], last[1] + 1)
+
+    def lookup(self, ids: List[tuple]) -> List[tuple]:
+        wanted = set(ids)
+        return [entry for entry in self.entries if entry[0] in wanted]
+
+
+# ---------------------------------------------------------------------------
+# Detail view API
+
+class LatencyModel:
+    """Seeded latency sampler
+
+    dist is 'constant', 'normal' or 'lognormal' around mean_ms; tail_prob of
+    requests instead take tail_ms, to model stragglers.
+    """
+
+    def __init__(self, dist: str = 'lognormal', mean_ms: float = 50.0, sigma: float = 0.5,
+                 tail_prob: float = 0.0, tail_ms: float = 0.0, seed: int = 1):
+        self.dist = dist
+        self.mean = mean_ms / 1000
+        self.sigma = sigma
+        self.tail_prob = tail_prob
+        self.tail = tail_ms / 1000
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.tail_prob and self._random.random() < self.tail_prob:
+                return self.tail
+            if self.dist == 'constant':
+                return self.mean
+            if self.dist == 'normal':
+                return max(0.0, self._random.gauss(self.mean, self.mean * self.sigma))
+            # Lognormal with the requested mean
+            mu = math.log(max(self.mean, 1e-6)) - self.sigma ** 2 / 2
+            return self._random.lognormvariate(mu, self.sigma)
+
+
+WORDS = (
+    'price listing seller rating shipping condition description warranty '
+    'available colour size brand model category stock delivery review'
+).split()
+
+
+def make_detail(url: str, payload_bytes: int, rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """Detail page payload with roughly the redundancy of real scraped text"""
+    rng = rng or random
+    words = []
+    size = 0
+    while size < payload_bytes:
+        word = rng.choice(WORDS) if rng.random() < 0.8 else f'{rng.randint(0, 99999)}'
+        words.append(word)
+        size += len(word) + 1
+    return {'url': url, 'title': ' '.join(words[:8]), 'detail': ' '.join(words)}
+
+
+class _DetailHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so connection reuse shows up
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        url = json.loads(body).get('url')
+        active = server.record_request()
+        try:
+            # Beyond capacity requests queue up, and past twice capacity they are shed
+            overload = active / server.capacity if server.capacity else 0.0
+            time.sleep(server.latency.sample() * max(1.0, overload))
+        finally:
+            server.finish_request_slot()
+
+        status = 200
+        if overload > 2 or server.in_outage() or (server.error_rate and server.roll() < server.error_rate):
+            status = 503
+        elif server.origin_throttled(url):
+            status = 429
+        response = json.dumps(make_detail(url, server.payload_bytes) if status == 200 else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDetailAPI(ThreadingHTTPServer):
+    """Detail view API stand-in with configurable latency, payload size and error rate
+
+    capacity (0 = unlimited) models an upstream that degrades under load:
+    latency scales with concurrent requests beyond it, and requests arriving
+    at more than twice the capacity get a 503. outage_at/outage_seconds make
+    every request fail with 503 for that span, measured from the first request.
+    origin_rate (0 = unlimited) models the scraped sites rate limiting the
+    service: past that many requests for one host within a second, the
+    request gets a 429.
+    """
+
+    request_queue_size = 128  # Several consumers connecting at once overflow the default backlog of 5
+
+    def __init__(self, latency: LatencyModel, payload_bytes: int = 2048, error_rate: float = 0.0, seed: int = 1,
+                 capacity: int = 0, outage_at: float = 0.0, outage_seconds: float = 0.0, origin_rate: int = 0):
+        super().__init__(('127.0.0.1', 0), _DetailHandler)
+        self.latency = latency
+        self._random = random.Random(seed)
+        self.payload_bytes = payload_bytes
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.outage_at = outage_at
+        self.outage_seconds = outage_seconds
+        self.origin_rate = origin_rate
+        self.throttled = 0
+        self._origin_requests: Dict[str, deque] = {}
+        self.active = 0
+        self.peak_active = 0
+        self.requests = 0
+        self.peak_rate = 0
+        self._last_second: deque = deque()
+        self.first_request_at: Optional[float] = None
+        self._lock = threading.Lock()
+        _serve(self)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/api/detail'
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def record_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            now = time.monotonic()
+            while self._last_second and self._last_second[0] <= now - 1.0:
+                self._last_second.popleft()
+            self._last_second.append(now)
+            self.peak_rate = max(self.peak_rate, len(self._last_second))
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+            return self.active
+
+    def in_outage(self) -> bool:
+        if not self.outage_seconds or self.first_request_at is None:
+            return False
+        elapsed = time.time() - self.first_request_at
+        return self.outage_at <= elapsed < self.outage_at + self.outage_seconds
+
+    def origin_throttled(self, url: str) -> bool:
+        """Count a request against its host; True once the host is over origin_rate for the last second"""
+        if not self.origin_rate:
+            return False
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        with self._lock:
+            recent = self._origin_requests.setdefault(host, deque())
+            while recent and recent[0] <= now - 1.0:
+                recent.popleft()
+            recent.append(now)
+            if len(recent) > self.origin_rate:
+                self.throttled += 1
+                return True
+            return False
+
+    def finish_request_slot(self):
+        with self._lock:
+            self.active -= 1
+
+
+# ---------------------------------------------------------------------------
+# S3
+
+class _S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        body = self._read_body()
+        self.server.receive(self.path, body, self.headers.get('Content-Encoding', ''))
+        self.send_response(200)
+        self.send_header('ETag', '"00000000000000000000000000000000"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass  # Trailers
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeS3(ThreadingHTTPServer):
+    """S3-compatible PUT endpoint that measures what it receives
+
+    Records are decoded (gzip/zstd and NDJSON aware) so end-to-end latency
+    can be taken from the bench_enqueued_at field the benchmark producer adds.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _S3Handler)
+        self.objects = 0
+        self.records = 0
+        self.bytes = 0
+        self.latencies: List[float] = []
+        self.last_record_at: Optional[float] = None
+        self.received = threading.Condition()
+        _serve(self)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def receive(self, path: str, body: bytes, encoding: str):
+        now = time.time()
+        raw = body
+        if encoding == 'gzip':
+            raw = gzip.decompress(body)
+        elif encoding == 'zstd' and zstandard is not None:
+            raw = zstandard.ZstdDecompressor().decompress(body)
+
+        latencies = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                enqueued_at = json.loads(line).get('bench_enqueued_at')
+            except ValueError:
+                enqueued_at = None
+            latencies.append(now - enqueued_at if enqueued_at else None)
+
+        with self.received:
+            self.objects += 1
+            self.bytes += len(body)
+            self.records += len(latencies)
+            self.latencies.extend(latency for latency in latencies if latency is not None)
+            self.last_record_at = now
+            self.received.notify_all()
+
+    def wait_for(self, records: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.received:
+            while self.records < records:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.received.wait(remaining)
+        return True
@@ -0,0 +1,162 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Set, Tuple
+
+import redis
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+class StreamQueue:
+    """Intake from a Redis Stream through a consumer group
+
+    Producers XADD entries with the message JSON in a 'message' field.
+    Workers read with XREADGROUP (COUNT per round trip), acknowledge with
+    batched XACKs, and periodically XAUTOCLAIM entries that another consumer
+    left pending for longer than claim_idle_ms, so a crashed worker's share
+    is picked up without a separate reaper. An entry whose store fails stays
+    pending and is reclaimed the same way. Entries this consumer is still
+    working on are never reclaimed by it, however long they take.
+    """
+
+    def __init__(self, redis_client: Any, stream_name: str, group: str, consumer: str,
+                 ack_batch_size: int = 50, ack_interval: float = 1.0,
+                 claim_idle_ms: int = 60000, claim_interval: float = 30.0):
+        self.redis_client = redis_client
+        self.stream_name = stream_name
+        self.group = group
+        self.consumer = consumer
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+
+        self._acks: List[str] = []
+        self._ack_lock = threading.Lock()
+        # Entries this consumer has taken and not yet acknowledged or given up on
+        self._held: Set[str] = set()
+        self._claimed = deque()
+        self._claim_cursor = '0-0'
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Create the consumer group if needed and start housekeeping"""
+        try:
+            # Start from the beginning so entries added before the group existed are not skipped
+            self.redis_client.xgroup_create(self.stream_name, self.group, id='0', mkstream=True)
+            logger.info(f"Created consumer group {self.group} on stream {self.stream_name}")
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._thread = threading.Thread(target=self._housekeeping, name='stream-queue', daemon=True)
+        self._thread.start()
+
+    def fetch(self, batch_size: int, timeout: float) -> List[Tuple[str, str]]:
+        """Read up to batch_size entries as (message_json, entry_id), reclaimed entries first"""
+        if self._claimed:
+            batch = []
+            while self._claimed and len(batch) < batch_size:
+                batch.append(self._claimed.popleft())
+            return batch  # Already held since claim_stuck
+
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream_name: '>'},
+            count=batch_size, block=max(1, int(timeout * 1000))
+        )
+        # redis-py parses RESP2 as [[stream, entries]] and RESP3 as {stream: [entries]}
+        if isinstance(response, dict):
+            streams = [entries for (entries,) in response.values()]
+        else:
+            streams = [entries for _, entries in response or []]
+        batch = []
+        for entries in streams:
+            batch.extend(self._to_messages(entries))
+        with self._ack_lock:
+            self._held.update(entry_id for _, entry_id in batch)
+        return batch
+
+    def ack(self, entry_id: str):
+        """Mark an entry as done; it is acknowledged with the next XACK batch"""
+        with self._ack_lock:
+            self._acks.append(entry_id)
+            flush = len(self._acks) >= self.ack_batch_size
+        if flush:
+            self.flush_acks()
+
+    def requeue(self, entry_id: str):
+        """Leave the entry pending so XAUTOCLAIM redelivers it after claim_idle_ms"""
+        with self._ack_lock:
+            self._held.discard(entry_id)
+        metrics.RELIABLE_REQUEUED.inc()
+
+    def flush_acks(self):
+        with self._ack_lock:
+            acks, self._acks = self._acks, []
+        if not acks:
+            return
+        try:
+            self.redis_client.xack(self.stream_name, self.group, *acks)
+            with self._ack_lock:
+                self._held.difference_update(acks)
+            metrics.RELIABLE_ACKS.inc(len(acks))
+        except Exception as e:
+            with self._ack_lock:
+                self._acks[:0] = acks
+            logger.error(f"Failed to acknowledge {len(acks)} stream entries: {str(e)}")
+
+    def claim_stuck(self, count: int = 100) -> int:
+        """Take over idle pending entries, skipping the ones this consumer still holds"""
+        if len(self._claimed) >= count:
+            return 0  # Still working through the previous claim
+        cursor, entries = self.redis_client.xautoclaim(
+            self.stream_name, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id=self._claim_cursor, count=count
+        )[:2]
+        self._claim_cursor = cursor
+        with self._ack_lock:
+            messages = [message for message in self._to_messages(entries) if message[1] not in self._held]
+            self._held.update(entry_id for _, entry_id in messages)
+        self._claimed.extend(messages)
+        if messages:
+            logger.warning(f"Claimed {len(messages)} stuck entries from {self.stream_name}")
+        metrics.RELIABLE_REAPED.inc(len(messages))
+        return len(messages)
+
+    def lag(self) -> Dict[str, int]:
+        """Entries not yet delivered to the group (lag) and delivered but unacknowledged (pending)"""
+        for info in self.redis_client.xinfo_groups(self.stream_name):
+            if info.get('name') == self.group:
+                return {'lag': int(info.get('lag') or 0), 'pending': int(info.get('pending') or 0)}
+        return {'lag': 0, 'pending': 0}
+
+    def close(self):
+        """Flush acknowledgements; anything unfinished stays pending for other consumers"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_acks()
+
+    def _to_messages(self, entries) -> List[Tuple[str, str]]:
+        messages = []
+        for entry_id, fields in entries:
+            if fields is None:
+                continue  # Deleted from the stream while pending
+            messages.append((fields.get('message', ''), entry_id))
+        return messages
+
+    def _housekeeping(self):
+        next_claim = time.monotonic() + self.claim_interval
+        while not self._stop.wait(self.ack_interval):
+            try:
+                self.flush_acks()
+                if time.monotonic() >= next_claim:
+                    self.claim_stuck()
+                    next_claim = time.monotonic() + self.claim_interval
+            except Exception as e:
+                logger.error(f"Stream queue housekeeping failed: {str(e)}")
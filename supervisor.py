@@ -0,0 +1,232 @@
+"""Pre-fork supervisor: run several consumer processes in one container
+
+Worker processes are forked from a forkserver that has already imported
+the consumer, its engines, boto3 and httpx, so they share those pages
+copy-on-write and start in well under a second. Workers that exit are
+restarted, with a backoff when they keep dying right after starting.
+METRICS_PORT is served by the supervisor: each worker serves its own
+metrics on a loopback port and a scrape returns all of them, labelled
+with worker="<index>", along with the supervisor's own worker metrics.
+
+    CONSUMER_PROCESSES=8 python supervisor.py
+"""
+import os
+import re
+import time
+import signal
+import logging
+import multiprocessing
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Imported once in the forkserver and shared by every worker forked from it
+PRELOAD = ['main', 'async_consumer', 'boto3', 'botocore.session', 'httpx', 'requests']
+
+PROCESSED_SAMPLE = re.compile(r'^consumer_messages_processed_total\{result="([^"]*)"\} (\S+)$')
+
+
+def default_processes() -> int:
+    """CPUs this process may run on, which respects container CPU sets"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_main(index: int, port_sender):
+    """Entry point of a worker process"""
+    # The supervisor owns METRICS_PORT; this worker's metrics go out on a loopback port instead
+    server = metrics.start_metrics_server(0, host='127.0.0.1')
+    port_sender.send(server.server_address[1])
+    port_sender.close()
+    os.environ['METRICS_PORT'] = '0'
+    if os.getenv('WORKER_ID'):
+        # An explicit id would otherwise be shared, e.g. as the stream consumer name
+        os.environ['WORKER_ID'] = f"{os.environ['WORKER_ID']}-{index}"
+    # Ctrl-C reaches the whole process group; leave shutting down to the supervisor's SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from main import run_consumer
+    run_consumer()
+
+
+class Worker:
+    """One worker slot: the current process and what it takes to restart it"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.port_receiver = None
+        self.metrics_port: Optional[int] = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.backoff = 0.0
+
+
+class Supervisor:
+    """Keeps CONSUMER_PROCESSES workers running until SIGTERM or SIGINT"""
+
+    def __init__(self):
+        self.processes = int(os.getenv('CONSUMER_PROCESSES', 0)) or default_processes()
+        # A worker that dies sooner than this after starting is restarted with a growing delay
+        self.min_uptime = float(os.getenv('WORKER_MIN_UPTIME', 10))
+        self.max_restart_delay = float(os.getenv('WORKER_MAX_RESTART_DELAY', 30))
+        # Time workers get to finish in-flight messages and flush S3 buffers on shutdown
+        self.shutdown_timeout = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', 60))
+        self.metrics_port = int(os.getenv('METRICS_PORT', 0))
+        self.report_interval = int(os.getenv('INTAKE_REPORT_INTERVAL', 60))
+
+        self.context = multiprocessing.get_context('forkserver')
+        self.context.set_forkserver_preload(PRELOAD)
+        self.workers = [Worker(index) for index in range(self.processes)]
+        self.stopping = False
+        self.metrics_server = None
+        self._scraper = ThreadPoolExecutor(max_workers=min(32, self.processes), thread_name_prefix='scrape')
+        self._last_report = time.monotonic()
+        metrics.WORKERS.set_function(lambda: sum(1 for worker in self.workers if self._alive(worker)))
+
+    def start_worker(self, worker: Worker):
+        port_receiver, port_sender = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(
+            target=worker_main, args=(worker.index, port_sender), name=f'consumer-{worker.index}'
+        )
+        worker.process.start()
+        port_sender.close()
+        worker.port_receiver = port_receiver
+        worker.metrics_port = None
+        worker.started_at = time.monotonic()
+        logger.info(f"Started worker {worker.index} (pid {worker.process.pid})")
+
+    def check_workers(self):
+        """Restart workers that exited and pick up the metrics ports of new ones"""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.port_receiver is not None and worker.port_receiver.poll():
+                try:
+                    worker.metrics_port = worker.port_receiver.recv()
+                except EOFError:
+                    pass  # Died before its metrics server came up
+                worker.port_receiver.close()
+                worker.port_receiver = None
+
+            if self._alive(worker):
+                continue
+            if worker.process is not None:
+                self._reap(worker, now)
+            if now >= worker.restart_at:
+                self.start_worker(worker)
+
+    def _reap(self, worker: Worker, now: float):
+        uptime = now - worker.started_at
+        logger.error(
+            f"Worker {worker.index} (pid {worker.process.pid}) exited with code {worker.process.exitcode} "
+            f"after {uptime:.1f}s"
+        )
+        worker.process.close()
+        worker.process = None
+        worker.metrics_port = None
+        # Crash loops back off exponentially; a worker that ran a while is restarted at once
+        if uptime < self.min_uptime:
+            worker.backoff = min(self.max_restart_delay, max(1.0, worker.backoff * 2))
+        else:
+            worker.backoff = 0.0
+        worker.restart_at = now + worker.backoff
+        if worker.backoff:
+            logger.warning(f"Restarting worker {worker.index} in {worker.backoff:.0f}s")
+        metrics.WORKER_RESTARTS.inc()
+
+    def _alive(self, worker: Worker) -> bool:
+        return worker.process is not None and worker.process.is_alive()
+
+    def scrape(self) -> Dict[str, str]:
+        """Every live worker's metrics text, keyed by worker index"""
+        targets = [worker for worker in self.workers if worker.metrics_port and self._alive(worker)]
+        texts = self._scraper.map(self._scrape_worker, targets)
+        return {str(worker.index): text for worker, text in zip(targets, texts) if text}
+
+    def _scrape_worker(self, worker: Worker) -> str:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{worker.metrics_port}/metrics', timeout=5) as response:
+                return response.read().decode('utf-8')
+        except Exception as e:
+            logger.warning(f"Failed to scrape metrics from worker {worker.index}: {str(e)}")
+            return ''
+
+    def render_metrics(self) -> str:
+        own = metrics.REGISTRY.render(metrics.SUPERVISOR_METRICS)
+        return own + metrics.merge_expositions(self.scrape(), skip=metrics.SUPERVISOR_METRICS)
+
+    def report(self):
+        """Log totals across workers, summed from their metrics"""
+        fetched = 0.0
+        outcomes: Dict[str, float] = {}
+        for text in self.scrape().values():
+            for line in text.splitlines():
+                if line.startswith('consumer_messages_fetched_total '):
+                    fetched += float(line.rpartition(' ')[2])
+                match = PROCESSED_SAMPLE.match(line)
+                if match:
+                    outcomes[match.group(1)] = outcomes.get(match.group(1), 0.0) + float(match.group(2))
+        summary = ', '.join(f"{result} {count:.0f}" for result, count in sorted(outcomes.items()))
+        alive = sum(1 for worker in self.workers if self._alive(worker))
+        logger.info(
+            f"Workers: {alive}/{self.processes} alive, {metrics.WORKER_RESTARTS.get():.0f} restarts; "
+            f"{fetched:.0f} messages fetched" + (f" ({summary})" if summary else '')
+        )
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def shutdown(self):
+        """Ask every worker to finish up, and kill the ones that take too long"""
+        logger.info(f"Stopping {self.processes} workers...")
+        workers = [worker for worker in self.workers if self._alive(worker)]
+        for worker in workers:
+            worker.process.terminate()  # SIGTERM: the consumer flushes and exits cleanly
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker in workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.error(f"Worker {worker.index} did not stop within {self.shutdown_timeout}s, killing it")
+                worker.process.kill()
+                worker.process.join()
+        self._scraper.shutdown(wait=False)
+        logger.info("Supervisor shut down cleanly")
+
+    def run(self):
+        logger.info(f"Starting {self.processes} consumer workers")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker in self.workers:
+            self.start_worker(worker)
+        if self.metrics_port:
+            self.metrics_server = metrics.start_metrics_server(self.metrics_port, render=self.render_metrics)
+
+        try:
+            while not self.stopping:
+                self.check_workers()
+                if time.monotonic() - self._last_report >= self.report_interval:
+                    self.report()
+                    self._last_report = time.monotonic()
+                time.sleep(0.5)
+        finally:
+            self.shutdown()
+
+
+def load_env():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass  # dotenv not installed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_env()
+    Supervisor().run()
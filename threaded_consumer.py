@@ -0,0 +1,73 @@
+import os
+import queue
+import logging
+import threading
+from typing import Any, Optional
+
+import metrics
+from main import RedisConsumer
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedRedisConsumer(RedisConsumer):
+    """Thread-pool variant of RedisConsumer
+
+    The main thread only does intake: it fetches messages and puts them on
+    a bounded work queue, which WORKER_THREADS long-lived threads drain
+    through handle_message (process_message, then store_in_s3). Intake runs
+    up to WORK_QUEUE_SIZE messages ahead, so a thread that finishes a
+    message picks up the next one without waiting on Redis, and a full
+    queue blocks intake. All threads share the consumer's Redis connection
+    pool, pooled HTTP session and boto3 client, which are sized to the
+    thread count.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.worker_threads = self.max_in_flight
+        self.work_queue_size = max(1, int(os.getenv('WORK_QUEUE_SIZE', 2 * self.worker_threads)))
+        self.work_queue: 'queue.Queue[Optional[tuple]]' = queue.Queue(maxsize=self.work_queue_size)
+        self._threads = []
+        metrics.WORK_QUEUE_DEPTH.set_function(self.work_queue.qsize)
+
+    def configured_concurrency(self) -> int:
+        return max(1, int(os.getenv('WORKER_THREADS', os.getenv('MAX_IN_FLIGHT', 8))))
+
+    def start_processing(self):
+        for index in range(self.worker_threads):
+            thread = threading.Thread(target=self._work, name=f'worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.worker_threads} worker threads (work queue of {self.work_queue_size})")
+
+    def stop_processing(self):
+        """Let the threads finish everything already queued, then stop them"""
+        for _ in self._threads:
+            self.work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def dispatch(self, message_json: str, receipt: Any = None, netloc: Optional[str] = None):
+        """Queue a message for the worker threads, blocking intake while the work queue is full"""
+        self.work_queue.put((message_json, receipt, netloc))
+
+    def _work(self):
+        while True:
+            item = self.work_queue.get()
+            if item is None:
+                return
+            message_json, receipt, netloc = item
+            with self._in_flight_lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                self.handle_message(message_json, receipt)
+            except Exception as e:
+                logger.error(f"Unexpected error in worker thread: {str(e)}")
+            finally:
+                self._release_domain(netloc)
+                with self._in_flight_lock:
+                    self.in_flight -= 1